@@ -0,0 +1,189 @@
+import io
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, Integer, String, Date, ForeignKey
+
+from table_export import copy_to_statement
+
+# Tables of the attendance model translated in Cypher-to-SQL.sql, with the columns the graph keeps
+GRAPH_COLUMNS = {
+    'students': ['student_id', 'name'],
+    'sessions': ['session_id', 'date', 'module'],
+    'attendance': ['student_id', 'session_id'],
+}
+
+# The relational form of the graph that the SQL of Cypher-to-SQL.sql runs on; attendance is
+# indexed on both keys so the joins of the SQL can use them
+def build_graph_metadata(schema):
+    metadata = MetaData(schema=schema)
+    Table('students', metadata,
+          Column('student_id', Integer, primary_key=True),
+          Column('name', String))
+    Table('sessions', metadata,
+          Column('session_id', Integer, primary_key=True),
+          Column('date', Date),
+          Column('module', String))
+    Table('attendance', metadata,
+          Column('student_id', Integer, ForeignKey(f'{schema}.students.student_id'), index=True),
+          Column('session_id', Integer, ForeignKey(f'{schema}.sessions.session_id'), index=True))
+    return metadata
+
+# Compressed sparse rows of the edges sources -> targets: the neighbours of node i are
+# indices[offsets[i]:offsets[i + 1]], in edge order
+def build_csr(sources, targets, n_sources):
+    order = np.argsort(sources, kind='stable')
+    offsets = np.zeros(n_sources + 1, dtype='int64')
+    np.cumsum(np.bincount(sources, minlength=n_sources), out=offsets[1:])
+    return offsets, np.asarray(targets)[order].astype('int32')
+
+# Neighbours of several nodes at once, concatenated in node order
+def gather(offsets, indices, rows):
+    rows = np.asarray(rows, dtype='int64')
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    steps = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return indices[np.repeat(starts, lengths) + steps]
+
+# Dense row of every id in ids (-1 for unknown ids); ids must be unique
+def row_index(ids, name):
+    index = pd.Index(ids)
+    if not index.is_unique:
+        raise ValueError(f"Duplicate {name} ids")
+    return index
+
+# One graph table read through COPY ... TO STDOUT, which is much faster than a SELECT for the
+# tens of millions of attendance rows
+def read_graph_table(engine, schema, table):
+    buffer = io.BytesIO()
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.copy_expert(copy_to_statement(engine, schema, table, 'csv'), buffer)
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
+    buffer.seek(0)
+    return pd.read_csv(buffer, usecols=GRAPH_COLUMNS[table])
+
+# The student-session attendance graph held in memory as two CSR adjacencies (student ->
+# sessions and session -> students) over dense int32 rows, with CSR indexes from names to
+# students and from modules to sessions. The queries answer Q1-Q5 of Cypher-to-SQL.sql with
+# the same results as the SQL (rows in an unspecified order, like the SQL) by walking the arrays
+# instead of joining tables. Duplicate attendance rows stay and count twice. Attendance rows
+# pointing at an unknown student or session are refused: Q2-Q5 do not all join both sides, so
+# the SQL counts such rows in some queries and drops them in others, which no single graph can
+# reproduce (the foreign keys of build_graph_metadata rule them out).
+class AttendanceGraph:
+    def __init__(self, students, sessions, attendance):
+        student_index = row_index(students['student_id'], 'student')
+        session_index = row_index(sessions['session_id'], 'session')
+        self.student_ids = student_index.to_numpy()
+        self.session_ids = session_index.to_numpy()
+        self.session_dates = sessions['date'].to_numpy()
+        self.name_codes, self.names = pd.factorize(students['name'], use_na_sentinel=False)
+        self.module_codes, self.modules = pd.factorize(sessions['module'], use_na_sentinel=False)
+
+        student_rows = student_index.get_indexer(attendance['student_id'])
+        session_rows = session_index.get_indexer(attendance['session_id'])
+        for rows, column in ((student_rows, 'student_id'), (session_rows, 'session_id')):
+            unknown = np.flatnonzero(rows < 0)
+            if len(unknown):
+                raise ValueError(f"Attendance integrity error: {len(unknown)} rows reference an unknown {column}, "
+                                 f"e.g. {attendance[column].iloc[unknown[0]]}")
+        self.student_offsets, self.student_edges = build_csr(student_rows, session_rows, len(self.student_ids))
+        self.session_offsets, self.session_edges = build_csr(session_rows, student_rows, len(self.session_ids))
+        self.name_offsets, self.name_members = build_csr(self.name_codes, np.arange(len(self.student_ids)), len(self.names))
+        self.module_offsets, self.module_members = build_csr(self.module_codes, np.arange(len(self.session_ids)), len(self.modules))
+
+    @classmethod
+    def from_database(cls, engine, schema=None):
+        started = time.perf_counter()
+        tables = {table: read_graph_table(engine, schema, table) for table in GRAPH_COLUMNS}
+        tables['sessions']['date'] = pd.to_datetime(tables['sessions']['date'])
+        graph = cls(tables['students'], tables['sessions'], tables['attendance'])
+        print(f"Loaded {len(graph.student_ids)} students, {len(graph.session_ids)} sessions and "
+              f"{graph.edge_count()} attendances in {time.perf_counter() - started:.2f}s ({graph.nbytes() / 1e6:.1f} MB)")
+        return graph
+
+    def edge_count(self):
+        return len(self.student_edges)
+
+    # Memory held by the arrays of the graph
+    def nbytes(self):
+        arrays = [self.student_ids, self.session_ids, self.session_dates, self.name_codes, self.module_codes,
+                  self.student_offsets, self.student_edges, self.session_offsets, self.session_edges,
+                  self.name_offsets, self.name_members, self.module_offsets, self.module_members]
+        return sum(array.nbytes for array in arrays)
+
+    # Rows of the students called name (names are not unique)
+    def students_named(self, name):
+        code = self.names.get_indexer([name])[0]
+        if code < 0:
+            return np.empty(0, dtype='int32')
+        return self.name_members[self.name_offsets[code]:self.name_offsets[code + 1]]
+
+    def student_frame(self, rows):
+        return pd.DataFrame({'name': self.names[self.name_codes[rows]], 'student_id': self.student_ids[rows]})
+
+    # Q1: the sessions (id and date) attended by the students called name
+    def student_sessions(self, name):
+        sessions = gather(self.student_offsets, self.student_edges, self.students_named(name))
+        return pd.DataFrame({'session_id': self.session_ids[sessions], 'date': self.session_dates[sessions]})
+
+    # Q2: the names with the most attendances, students sharing a name counted together
+    def top_attendees(self, limit=3):
+        counts = np.bincount(self.name_codes, weights=np.diff(self.student_offsets), minlength=len(self.names))
+        counts = pd.Series(counts.astype('int64'), index=self.names)
+        counts = counts[counts > 0].nlargest(limit)
+        return pd.DataFrame({'name': counts.index, 'session_count': counts.to_numpy()})
+
+    # Q3: attendances per session, for the sessions that have any
+    def session_attendance(self):
+        counts = np.diff(self.session_offsets)
+        attended = counts > 0
+        return pd.DataFrame({'session_id': self.session_ids[attended], 'student_count': counts[attended]})
+
+    # Q4: distinct students per module, for the modules that have any
+    def module_unique_students(self):
+        n_students = max(len(self.student_ids), 1)
+        # One key per (module, student) edge; the distinct keys are the module's distinct students
+        edge_modules = np.repeat(self.module_codes.astype('int64'), np.diff(self.session_offsets))
+        pairs = pd.unique(edge_modules * n_students + self.session_edges)
+        counts = np.bincount(pairs // n_students, minlength=len(self.modules))
+        attended = counts > 0
+        return pd.DataFrame({'module': self.modules[attended], 'unique_students': counts[attended]})
+
+    # Q5: the students without any attendance
+    def absent_students(self):
+        return self.student_frame(np.flatnonzero(np.diff(self.student_offsets) == 0))
+
+    # The students (one row per attendance) of one session
+    def session_students(self, session_id):
+        row = pd.Index(self.session_ids).get_indexer([session_id])[0]
+        if row < 0:
+            return self.student_frame(np.empty(0, dtype='int32'))
+        return self.student_frame(self.session_edges[self.session_offsets[row]:self.session_offsets[row + 1]])
+
+    # Distinct students who attended any session of module
+    def module_students(self, module):
+        code = self.modules.get_indexer([module])[0]
+        if code < 0:
+            return self.student_frame(np.empty(0, dtype='int32'))
+        sessions = self.module_members[self.module_offsets[code]:self.module_offsets[code + 1]]
+        return self.student_frame(np.unique(gather(self.session_offsets, self.session_edges, sessions)))
+
+    # Two hops: the other students who attended a session with the students called name, by
+    # the number of attendances they shared
+    def co_attendees(self, name, limit=None):
+        students = self.students_named(name)
+        sessions = gather(self.student_offsets, self.student_edges, students)
+        others = gather(self.session_offsets, self.session_edges, sessions)
+        others = others[~np.isin(others, students)]
+        rows, shared = np.unique(others, return_counts=True)
+        frame = self.student_frame(rows)
+        frame['shared_sessions'] = shared
+        frame = frame.sort_values('shared_sessions', ascending=False, kind='stable').reset_index(drop=True)
+        return frame if limit is None else frame.head(limit)
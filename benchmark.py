@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from synthetic_data import SOURCE_CSV, DEFAULT_NULL_RATE, build_profile, write_synthetic_csv
+
+PIPELINES = ['export_flattened_csv.py', 'etl_pipeline.py']
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Synthetic input of one scale, generated once per row count and seed and reused afterwards
+def synthetic_input(work_dir, rows, seed, null_rate, profile):
+    path = os.path.join(work_dir, f'subscriptions_{rows}_seed{seed}.csv')
+    if os.path.exists(path):
+        print(f"Reusing {path}")
+        return path, 0.0
+    seconds = write_synthetic_csv(f'{path}.tmp', rows, seed=seed, null_rate=null_rate, profile=profile)
+    os.replace(f'{path}.tmp', path)
+    return path, seconds
+
+# Run one pipeline on one input in its own process (so peak memory is per run) and return the
+# stage records it wrote through --metrics-file
+def run_pipeline(pipeline, csv_path, work_dir, schema, pipeline_args):
+    metrics_path = os.path.join(work_dir, 'run_metrics.jsonl')
+    if os.path.exists(metrics_path):
+        os.remove(metrics_path)
+    command = [sys.executable, os.path.join(script_dir, pipeline), '--csv-path', csv_path, '--metrics-file', metrics_path]
+    if pipeline == 'export_flattened_csv.py':
+        command += ['--output', os.path.join(work_dir, 'flattened_subscription_data.csv')]
+    command += pipeline_args
+    # The benchmark owns its schema, the pipelines drop and recreate it
+    environment = {**os.environ, 'SCHEMA': schema}
+    started = time.perf_counter()
+    result = subprocess.run(command, env=environment, capture_output=True, text=True)
+    wall_seconds = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"{pipeline} failed on {csv_path}: {result.stderr.strip()}")
+    with open(metrics_path, encoding='utf-8') as handle:
+        records = [json.loads(line) for line in handle if line.strip()]
+    return records, wall_seconds
+
+# Latest stage records of a results file, keyed by (pipeline, scale, stage)
+def read_baseline(path):
+    baseline = {}
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            if line.strip():
+                record = json.loads(line)
+                baseline[(record['pipeline'], record['scale'], record['stage'])] = record
+    return baseline
+
+# Stages that got slower than the baseline by more than tolerance (0.2 = 20%)
+def find_regressions(records, baseline, tolerance):
+    regressions = []
+    for record in records:
+        previous = baseline.get((record['pipeline'], record['scale'], record['stage']))
+        if previous is None or record['kind'] == 'table_load' or previous['wall_seconds'] <= 0:
+            continue
+        change = record['wall_seconds'] / previous['wall_seconds'] - 1
+        record['baseline_change'] = change
+        if change > tolerance:
+            regressions.append(record)
+    return regressions
+
+# One line per stage: time, throughput, the process RSS high-water mark and how much the stage
+# raised it, and the change against the baseline
+def report(records):
+    print(f"{'scale':>10} {'stage':<28} {'seconds':>9} {'rows/s':>12} {'proc peak MB':>12} {'+peak MB':>9} {'vs baseline':>12}")
+    for record in records:
+        rate = record.get('rows_per_second')
+        rss = record.get('process_peak_rss_bytes')
+        growth = record.get('peak_rss_growth_bytes')
+        change = record.get('baseline_change')
+        print(f"{record['scale']:>10} {record['stage']:<28} {record['wall_seconds']:>9.2f} "
+              f"{f'{rate:,.0f}' if rate is not None else '-':>12} {f'{rss / 1e6:.1f}' if rss is not None else '-':>12} "
+              f"{f'{growth / 1e6:.1f}' if growth is not None else '-':>9} "
+              f"{f'{change:+.1%}' if change is not None else '-':>12}")
+
+# Generate every scale, run the pipeline on it and append the stage records to the results file
+def run_benchmark(pipeline, scales, work_dir, results_path, schema, seed=0, null_rate=DEFAULT_NULL_RATE,
+                  pipeline_args=None, baseline=None, tolerance=0.2, source=SOURCE_CSV):
+    os.makedirs(work_dir, exist_ok=True)
+    profile = build_profile(source)
+    started = datetime.now().isoformat(timespec='seconds')
+    results = []
+    for rows in scales:
+        csv_path, generate_seconds = synthetic_input(work_dir, rows, seed, null_rate, profile)
+        print(f"Running {pipeline} on {rows} rows...")
+        records, wall_seconds = run_pipeline(pipeline, csv_path, work_dir, schema, pipeline_args or [])
+        records.append({'stage': 'total', 'kind': 'run', 'rows': rows, 'wall_seconds': wall_seconds,
+                        'rows_per_second': rows / wall_seconds if wall_seconds > 0 else None,
+                        'process_peak_rss_bytes': max((record.get('process_peak_rss_bytes') or 0 for record in records), default=None),
+                        'generate_seconds': generate_seconds})
+        for record in records:
+            record.update({'benchmark_started': started, 'pipeline': pipeline, 'scale': rows, 'seed': seed,
+                           'pipeline_args': ' '.join(pipeline_args or [])})
+        results.extend(records)
+
+    regressions = find_regressions(results, baseline, tolerance) if baseline else []
+    report(results)
+    with open(results_path, 'a', encoding='utf-8') as handle:
+        for record in results:
+            handle.write(json.dumps(record) + '\n')
+    print(f"Benchmark results appended to {results_path}")
+    for record in regressions:
+        print(f"Regression: {record['stage']} at {record['scale']} rows is {record['baseline_change']:+.1%} slower than the baseline")
+    return results, regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ETL on synthetic subscriptions at several scales")
+    parser.add_argument('--pipeline', choices=PIPELINES, default='export_flattened_csv.py', help="Entry point to benchmark")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help="Row counts to generate and run")
+    parser.add_argument('--pipeline-args', type=str, default='', help="Extra pipeline arguments, e.g. \"--streaming --chunk-size 50000\"")
+    parser.add_argument('--work-dir', type=str, default='benchmark_data', help="Where synthetic inputs and extracts are written")
+    parser.add_argument('--results', type=str, default='benchmark_results.jsonl', help="JSON lines file the stage records are appended to")
+    parser.add_argument('--schema', type=str, default='benchmark', help="Database schema the pipeline rebuilds (SCHEMA override)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the synthetic data")
+    parser.add_argument('--null-rate', type=float, default=DEFAULT_NULL_RATE, help="Extra share of nulls in the synthetic data")
+    parser.add_argument('--baseline', type=str, help="Earlier results file to compare stage times against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Slowdown against the baseline reported as a regression")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 2 when a stage regressed")
+    args = parser.parse_args()
+    try:
+        load_dotenv()
+        baseline = read_baseline(args.baseline) if args.baseline else None
+        _, regressions = run_benchmark(args.pipeline, args.scales, os.path.abspath(args.work_dir), os.path.abspath(args.results),
+                                       args.schema, seed=args.seed, null_rate=args.null_rate,
+                                       pipeline_args=shlex.split(args.pipeline_args), baseline=baseline,
+                                       tolerance=args.tolerance, source=os.path.join(script_dir, SOURCE_CSV))
+    except Exception as e:
+        print(f"Benchmark failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    if regressions and args.fail_on_regression:
+        sys.exit(2)
@@ -0,0 +1,239 @@
+import csv
+import io
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, SmallInteger, BigInteger, Float, Numeric, String, Text, DateTime, Date, Boolean
+from sqlalchemy.schema import CreateTable, CreateIndex, AddConstraint
+
+from table_layout import create_partitions
+
+DEFAULT_BATCH_SIZE = 50000
+COPY_FORMATS = ('csv', 'binary')
+
+# PostgreSQL binary COPY framing
+PGCOPY_HEADER = b'PGCOPY\n\377\r\n\0' + struct.pack('!ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('!h', -1)
+PG_EPOCH = np.datetime64('2000-01-01T00:00:00', 'us')
+
+# Fixed-width binary encodings: (numpy big-endian dtype, field length)
+FIXED_WIDTH = {
+    'int2': ('>i2', 2),
+    'int4': ('>i4', 4),
+    'int8': ('>i8', 8),
+    'float8': ('>f8', 8),
+    'bool': ('>u1', 1),
+    'timestamp': ('>i8', 8),
+    'date': ('>i4', 4),
+}
+
+# Map a SQLAlchemy column type to the wire type used by the COPY encoders
+def pg_wire_type(column_type):
+    if isinstance(column_type, Boolean):
+        return 'bool'
+    if isinstance(column_type, SmallInteger):
+        return 'int2'
+    if isinstance(column_type, BigInteger):
+        return 'int8'
+    if isinstance(column_type, Integer):
+        return 'int4'
+    if isinstance(column_type, (Float, Numeric)):
+        return 'float8'
+    if isinstance(column_type, DateTime):
+        return 'timestamp'
+    if isinstance(column_type, Date):
+        return 'date'
+    if isinstance(column_type, (String, Text)):
+        return 'text'
+    raise TypeError(f"Unsupported column type for COPY: {column_type!r}")
+
+# Align a DataFrame with the target table: column order and target dtypes
+def prepare_frame(frame, table):
+    columns = [column for column in table.columns if column.name in frame.columns]
+    prepared = {}
+    for column in columns:
+        values = frame[column.name]
+        wire_type = pg_wire_type(column.type)
+        if wire_type in ('int2', 'int4', 'int8'):
+            # Float columns (e.g. median-filled experience) must be integral for COPY
+            prepared[column.name] = pd.to_numeric(values).round().astype('Int64')
+        elif wire_type == 'float8':
+            prepared[column.name] = pd.to_numeric(values).astype('float64')
+        elif wire_type == 'bool':
+            prepared[column.name] = values.astype('boolean')
+        elif wire_type in ('timestamp', 'date'):
+            prepared[column.name] = pd.to_datetime(values)
+        else:
+            prepared[column.name] = values.astype(object).where(values.notna(), None)
+    return pd.DataFrame(prepared, index=frame.index), columns
+
+# Build the COPY ... FROM STDIN statement for a table
+def copy_statement(engine, table, columns, copy_format):
+    preparer = engine.dialect.identifier_preparer
+    column_list = ', '.join(preparer.quote(column.name) for column in columns)
+    if copy_format == 'csv':
+        options = "FORMAT csv, NULL '\\N'"
+    else:
+        options = 'FORMAT binary'
+    return f"COPY {preparer.format_table(table)} ({column_list}) FROM STDIN WITH ({options})"
+
+# Encode one batch as CSV text
+def csv_buffer(batch):
+    buffer = io.StringIO()
+    batch.to_csv(buffer, index=False, header=False, na_rep='\\N', quoting=csv.QUOTE_MINIMAL,
+                 date_format='%Y-%m-%d %H:%M:%S.%f')
+    buffer.seek(0)
+    return buffer
+
+# Convert one column to a numpy array of fixed-width values plus a null mask
+def _fixed_width_values(values, wire_type):
+    mask = values.isna().to_numpy()
+    if wire_type == 'timestamp':
+        raw = values.to_numpy(dtype='datetime64[us]')
+        data = (raw - PG_EPOCH).astype('int64')
+    elif wire_type == 'date':
+        raw = values.dt.normalize().to_numpy(dtype='datetime64[us]')
+        data = ((raw - PG_EPOCH) // np.timedelta64(1, 'D')).astype('int64')
+    elif wire_type == 'bool':
+        data = values.fillna(False).to_numpy(dtype='uint8')
+    elif wire_type == 'float8':
+        data = values.fillna(0.0).to_numpy(dtype='float64')
+    else:
+        data = values.fillna(0).to_numpy(dtype='int64')
+    return data.astype(FIXED_WIDTH[wire_type][0]), mask
+
+# Encode one batch in PostgreSQL binary COPY format
+def binary_buffer(batch, wire_types):
+    n_rows = len(batch)
+    encoded = []
+    has_nulls = False
+    for name, wire_type in zip(batch.columns, wire_types):
+        if wire_type in FIXED_WIDTH:
+            data, mask = _fixed_width_values(batch[name], wire_type)
+        else:
+            values = batch[name].to_numpy(dtype=object)
+            mask = pd.isna(values)
+            data = [None if is_null else str(value).encode('utf-8') for value, is_null in zip(values, mask)]
+        has_nulls = has_nulls or bool(mask.any())
+        encoded.append((wire_type, data, mask))
+
+    buffer = io.BytesIO()
+    buffer.write(PGCOPY_HEADER)
+
+    if not has_nulls and all(wire_type in FIXED_WIDTH for wire_type, _, _ in encoded):
+        # Vectorized path: every row has the same byte layout
+        fields = [('count', '>i2')]
+        for position, (wire_type, _, _) in enumerate(encoded):
+            fields.append((f'len{position}', '>i4'))
+            fields.append((f'val{position}', FIXED_WIDTH[wire_type][0]))
+        rows = np.empty(n_rows, dtype=np.dtype(fields))
+        rows['count'] = len(encoded)
+        for position, (wire_type, data, _) in enumerate(encoded):
+            rows[f'len{position}'] = FIXED_WIDTH[wire_type][1]
+            rows[f'val{position}'] = data
+        buffer.write(rows.tobytes())
+    else:
+        field_count = struct.pack('!h', len(encoded))
+        null_field = struct.pack('!i', -1)
+        for row in range(n_rows):
+            parts = [field_count]
+            for wire_type, data, mask in encoded:
+                if mask[row]:
+                    parts.append(null_field)
+                else:
+                    # Slice rather than index so the big-endian layout is kept
+                    payload = data[row:row + 1].tobytes() if wire_type in FIXED_WIDTH else data[row]
+                    parts.append(struct.pack('!i', len(payload)) + payload)
+            buffer.write(b''.join(parts))
+
+    buffer.write(PGCOPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+# Stream a DataFrame through COPY ... FROM STDIN on an open DBAPI cursor, in batches
+def copy_frame(cursor, engine, table, frame, batch_size=DEFAULT_BATCH_SIZE, copy_format='csv'):
+    if copy_format not in COPY_FORMATS:
+        raise ValueError(f"Unknown COPY format '{copy_format}', expected one of {', '.join(COPY_FORMATS)}")
+    prepared, columns = prepare_frame(frame, table)
+    statement = copy_statement(engine, table, columns, copy_format)
+    wire_types = [pg_wire_type(column.type) for column in columns]
+    for start in range(0, len(prepared), batch_size):
+        batch = prepared.iloc[start:start + batch_size]
+        if copy_format == 'csv':
+            buffer = csv_buffer(batch)
+        else:
+            buffer = binary_buffer(batch, wire_types)
+        cursor.copy_expert(statement, buffer)
+
+# Load a DataFrame into PostgreSQL through COPY in its own transaction
+def copy_loader(engine, table, frame, batch_size=DEFAULT_BATCH_SIZE, copy_format='csv'):
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        copy_frame(cursor, engine, table, frame, batch_size=batch_size, copy_format=copy_format)
+        connection.commit()
+        cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+# The original load path, kept for comparison runs
+def to_sql_loader(engine, table, frame, batch_size=DEFAULT_BATCH_SIZE, copy_format=None):
+    frame.to_sql(table.name, engine, schema=table.schema, if_exists='append', index=False, chunksize=batch_size)
+
+LOADERS = {
+    'copy': copy_loader,
+    'to_sql': to_sql_loader,
+}
+
+# Load a single table with the chosen loader and report throughput
+def load_table(engine, table, frame, loader='copy', batch_size=DEFAULT_BATCH_SIZE, copy_format='csv'):
+    if loader not in LOADERS:
+        raise ValueError(f"Unknown loader '{loader}', expected one of {', '.join(LOADERS)}")
+    started = time.perf_counter()
+    create_partitions(engine, table, frame)
+    LOADERS[loader](engine, table, frame, batch_size=batch_size, copy_format=copy_format)
+    return report_load(table.name, loader, len(frame), time.perf_counter() - started)
+
+# Print and return the throughput of one table load
+def report_load(table_name, loader, rows, elapsed):
+    rate = rows / elapsed if elapsed > 0 else float('inf')
+    print(f"Loaded {rows} rows into {table_name} with {loader} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return {'table': table_name, 'loader': loader, 'rows': rows, 'seconds': elapsed, 'rows_per_second': rate}
+
+# Load several tables in dependency order; frames maps table name -> DataFrame
+def load_tables(engine, metadata, frames, loader='copy', batch_size=DEFAULT_BATCH_SIZE, copy_format='csv'):
+    stats = []
+    for table in metadata.sorted_tables:
+        if table.name in frames:
+            stats.append(load_table(engine, table, frames[table.name], loader=loader,
+                                    batch_size=batch_size, copy_format=copy_format))
+    return stats
+
+# Create every table without its foreign keys and indexes so they can be added after the bulk load
+def create_tables_without_foreign_keys(engine, metadata):
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            connection.execute(CreateTable(table, include_foreign_key_constraints=[]))
+
+# Add the foreign keys that were skipped by create_tables_without_foreign_keys
+def add_foreign_keys(engine, metadata):
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            for constraint in table.foreign_key_constraints:
+                connection.execute(AddConstraint(constraint))
+    print(f"Foreign keys added in {time.perf_counter() - started:.2f}s")
+
+# Create the indexes that were skipped by create_tables_without_foreign_keys, once the data is in
+def create_indexes(engine, metadata):
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index))
+    print(f"Indexes created in {time.perf_counter() - started:.2f}s")
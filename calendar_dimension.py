@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+# Fact columns keyed into dim_time and the subscription dates they are computed from
+FACT_DATE_COLUMNS = {
+    'StartTimeID': 'SubscriptionStartDate',
+    'EndTimeID': 'SubscriptionEndDate',
+    'DiplomaTimeID': 'DiplomaDate',
+}
+
+# Smart key of a date: the day as a YYYYMMDD integer (2024-02-11 -> 20240211), computed
+# arithmetically from datetime64 values. Missing dates give NA.
+def date_keys(values):
+    days = np.asarray(values, dtype='datetime64[D]')
+    missing = np.isnat(days)
+    months = days.astype('datetime64[M]')
+    year = months.astype('int64') // 12 + 1970
+    month = months.astype('int64') % 12 + 1
+    day = (days - months).astype('int64') + 1
+    keys = np.where(missing, 0, year * 10000 + month * 100 + day)
+    return pd.arrays.IntegerArray(keys.astype('int64'), missing)
+
+# Year, month and day encoded in YYYYMMDD keys
+def key_parts(keys):
+    keys = pd.array(keys, dtype='Int64')
+    return {'Year': keys // 10000, 'Month': keys // 100 % 100, 'Day': keys % 100}
+
+# Dates (at midnight) encoded in YYYYMMDD keys
+def key_dates(keys):
+    keys = pd.array(keys, dtype='Int64')
+    values = keys.to_numpy(dtype='int64', na_value=19700101)
+    months = (values // 10000 - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (values // 100 % 100 - 1)
+    dates = (months.astype('datetime64[D]') + (values % 100 - 1)).astype('datetime64[us]')
+    dates[keys.isna()] = np.datetime64('NaT')
+    return dates
+
+# Whole calendar years covering every date in `columns`. start/end only widen the range to their
+# years and never narrow it, since the facts key into every one of those dates.
+def calendar_range(columns, start=None, end=None):
+    lows = [column.min() for column in columns if column.notna().any()]
+    highs = [column.max() for column in columns if column.notna().any()]
+    if start is not None:
+        lows.append(pd.Timestamp(start))
+    if end is not None:
+        highs.append(pd.Timestamp(end))
+    if not lows:
+        lows = highs = [pd.Timestamp.today()]
+    return pd.Timestamp(min(lows).year, 1, 1), pd.Timestamp(max(highs).year, 12, 31)
+
+# Calendar dimension: one row per day from start to end, keyed by YYYYMMDD, with the
+# attributes dashboards group by precomputed
+def build_calendar(start, end):
+    dates = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D')
+    iso = dates.isocalendar()
+    return pd.DataFrame({
+        'TimeID': date_keys(dates),
+        'Date': dates,
+        'Year': dates.year,
+        'Quarter': dates.quarter,
+        'Month': dates.month,
+        'Week': iso['week'].to_numpy(dtype='int64'),  # ISO week number
+        'Weekday': iso['day'].to_numpy(dtype='int64'),  # ISO weekday, 1 = Monday
+        'Day': dates.day,
+        'YearMonth': dates.year * 100 + dates.month,  # Cohort key, e.g. 202401
+        'Cohort': dates.strftime('%Y-%m'),
+    })
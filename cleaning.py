@@ -0,0 +1,199 @@
+import codecs
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from calendar_dimension import date_keys
+
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+except ImportError:  # Extracts are then read with the C parser
+    pyarrow = None
+
+REQUIRED_COLUMNS = ['Student', 'InstructorFullName', 'GroupName', 'SubscriptionStartDate', 'SubscriptionProgress', 'SubscriptionHasDiploma']
+DATE_COLUMNS = ['StudentBirthDate', 'SubscriptionStartDate', 'SubscriptionEndDate', 'DiplomaDate']
+
+# Columns filled with the median / the most frequent value
+MEDIAN_COLUMNS = ['professionalExperience'] + DATE_COLUMNS
+MODE_COLUMNS = ['StudentGender', 'Industry']
+
+# Strings pandas treats as missing when inferring a date format
+NULL_DATE_STRINGS = {'', 'nat', 'NaT', 'NAT', 'nan', 'NaN', 'NAN', 'None'}
+
+# Strings read as missing values, the default list of pd.read_csv
+NULL_STRINGS = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# Typed schema of the extract. Descriptive columns repeat on every row and are read as
+# categoricals, so rows only hold integer codes and dedup/key building work on those codes; the
+# date and progress strings are categoricals too and get parsed once per distinct value.
+# Columns not listed (Student) keep the default string dtype.
+INPUT_DTYPES = {
+    'SessionName': 'category',
+    'TrackName': 'category',
+    'Hackerspace': 'category',
+    'Country': 'category',
+    'GroupName': 'category',
+    'ProductSchedule': 'category',
+    'StudentGender': 'category',
+    'Industry': 'category',
+    'InstructorFullName': 'category',
+    'InstructorEmail': 'category',
+    'instructor_diploma': 'category',
+    'StudentBirthDate': 'category',
+    'SubscriptionStartDate': 'category',
+    'SubscriptionEndDate': 'category',
+    'DiplomaDate': 'category',
+    'SubscriptionProgress': 'category',
+    'professionalExperience': 'Int16',
+    'SubscriptionHasDiploma': 'boolean',
+}
+
+# Encoding of an extract: UTF-8 (with or without BOM), falling back to cp1252
+def detect_encoding(path, block_size=1 << 20):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with open(path, 'rb') as handle:
+            while block := handle.read(block_size):
+                decoder.decode(block)
+            decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return 'cp1252'
+    return 'utf-8-sig'
+
+# Progress strings ('99.56%') as fractions (0.9956), converted once per distinct string
+def progress_fractions(values):
+    values = values.astype('category')
+    fractions = values.cat.categories.astype(str).str.rstrip('%').astype(float).to_numpy() / 100.0
+    return pd.Series(np.append(fractions, np.nan)[values.cat.codes.to_numpy()], index=values.index, name=values.name)
+
+# Types read_csv cannot apply itself
+def apply_input_types(df):
+    if 'SubscriptionProgress' in df.columns:
+        df['SubscriptionProgress'] = progress_fractions(df['SubscriptionProgress'])
+    return df
+
+# INPUT_DTYPES as arrow types: categoricals are dictionary-encoded strings, so dates and
+# progress stay strings whatever they look like
+def arrow_convert_options():
+    types = {'category': pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+             'Int16': pyarrow.int16(), 'boolean': pyarrow.bool_()}
+    column_types = {col: types[dtype] for col, dtype in INPUT_DTYPES.items()}
+    column_types['Student'] = pyarrow.string()
+    return pyarrow_csv.ConvertOptions(column_types=column_types, null_values=NULL_STRINGS, strings_can_be_null=True,
+                                      true_values=['True', 'TRUE', 'true'], false_values=['False', 'FALSE', 'false'])
+
+# Arrow rows as a typed frame. A slice of batches keeps their whole dictionaries, so its
+# categoricals drop the categories its rows do not use.
+def arrow_frame(table, sliced=False):
+    df = table.to_pandas(types_mapper={pyarrow.int16(): pd.Int16Dtype(), pyarrow.bool_(): pd.BooleanDtype()}.get)
+    if sliced:
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].cat.remove_unused_categories()
+    return apply_input_types(df)
+
+# Read the extract with the typed schema, through the multithreaded pyarrow CSV reader when
+# available. Whole files and chunks go through the same reader and types, so both see the same
+# raw values.
+def read_subscriptions(path, encoding='utf-8-sig'):
+    if pyarrow is None:
+        return apply_input_types(pd.read_csv(path, encoding=encoding, dtype=INPUT_DTYPES, na_values=NULL_STRINGS,
+                                             keep_default_na=False))
+    table = pyarrow_csv.read_csv(path, read_options=pyarrow_csv.ReadOptions(encoding=encoding),
+                                 convert_options=arrow_convert_options())
+    return arrow_frame(table)
+
+# Typed chunks of chunk_size rows
+def read_subscription_chunks(path, encoding='utf-8-sig', chunk_size=100000):
+    if pyarrow is None:
+        with pd.read_csv(path, encoding=encoding, dtype=INPUT_DTYPES, na_values=NULL_STRINGS, keep_default_na=False,
+                         chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield apply_input_types(chunk.reset_index(drop=True))
+        return
+    reader = pyarrow_csv.open_csv(path, read_options=pyarrow_csv.ReadOptions(encoding=encoding),
+                                  convert_options=arrow_convert_options())
+    pending, rows = [], 0
+    for batch in reader:
+        pending.append(batch)
+        rows += batch.num_rows
+        if rows < chunk_size:
+            continue
+        table = pyarrow.Table.from_batches(pending)
+        for start in range(0, rows - chunk_size + 1, chunk_size):
+            yield arrow_frame(table.slice(start, chunk_size), sliced=True)
+        done = rows - rows % chunk_size
+        pending, rows = table.slice(done).to_batches(), rows - done
+    if rows:
+        yield arrow_frame(pyarrow.Table.from_batches(pending, schema=reader.schema), sliced=True)
+
+# Fail early when the extract misses columns the star schema needs
+def validate_columns(columns):
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+
+# Date format per column, inferred from its first non-null value like pd.to_datetime does;
+# columns without any value yet are left out
+def detect_date_formats(df):
+    formats = {}
+    for col in DATE_COLUMNS:
+        for value in df[col]:
+            if isinstance(value, str) and value.strip() not in NULL_DATE_STRINGS:
+                formats[col] = guess_datetime_format(value)
+                break
+    return formats
+
+# Exact median from value counts (value -> count), computed the same way Series.median() would
+def median_from_counts(counts):
+    counts = counts[counts > 0].sort_index()
+    total = int(counts.sum())
+    if total == 0:
+        return None
+    cumulative = counts.cumsum().to_numpy()
+    lower = counts.index[np.searchsorted(cumulative, (total - 1) // 2, side='right')]
+    upper = counts.index[np.searchsorted(cumulative, total // 2, side='right')]
+    return pd.Series([lower, upper]).median()
+
+# Most frequent value; ties go to the smallest value like Series.mode()[0]
+def mode_from_counts(counts):
+    counts = counts[counts > 0]
+    if counts.empty:
+        return None
+    return sorted(counts[counts == counts.max()].index)[0]
+
+# Impute the missing values of the fill columns present in df, in place
+def fill_missing(df, fill_values):
+    for col, value in fill_values.items():
+        if value is None or col not in df.columns:
+            continue
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype) and value not in values.cat.categories:
+            # The file-wide mode may not occur in this chunk
+            values = values.cat.add_categories([value])
+        elif pd.api.types.is_integer_dtype(values.dtype) and value != int(value):
+            # Median halfway between two integers
+            values = values.astype('float64')
+        df[col] = values.fillna(value)
+    return df
+
+# Birth dates as read, before imputation, as YYYYMMDD integers with 0 for a missing date: the
+# student key, so a student whose birth date gets imputed stays one member whatever the
+# imputed value (the median moves as rows are loaded)
+def birth_date_keys(values):
+    return date_keys(values).fillna(0).to_numpy(dtype='int64')
+
+# Impute missing values and normalize progress (0-1) and diploma flags (0/1) in place; the
+# student key is taken first
+def apply_fills(df, fill_values):
+    df['BirthDateKey'] = birth_date_keys(df['StudentBirthDate'])
+    fill_missing(df, fill_values)
+    progress = df['SubscriptionProgress']
+    if not pd.api.types.is_numeric_dtype(progress.dtype):
+        progress = progress_fractions(progress)
+    df['SubscriptionProgress'] = progress.fillna(0.0)
+    df['SubscriptionHasDiploma'] = df['SubscriptionHasDiploma'].fillna(False).astype('int8')
+    return df
@@ -0,0 +1,128 @@
+import os
+import shutil
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed for the Parquet / Arrow outputs
+    pa = None
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'arrow')
+FILE_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+COMPRESSIONS = {
+    'parquet': ('zstd', 'snappy', 'gzip', 'lz4', 'none'),
+    'arrow': ('zstd', 'lz4', 'none'),
+}
+
+# Hive-style partition columns of a partitioned extract (StartYear=2024/StartMonth=1/...)
+PARTITION_COLUMNS = ['StartYear', 'StartMonth']
+
+# Arrow type of every extract column that should not keep its inferred type. Descriptive strings
+# repeat on every row and are dictionary-encoded; subscription dates are plain days.
+EXTRACT_TYPES = {
+    'StudentGender': 'dictionary', 'Industry': 'dictionary', 'GroupName': 'dictionary',
+    'SessionName': 'dictionary', 'TrackName': 'dictionary', 'Hackerspace': 'dictionary',
+    'Country': 'dictionary', 'ProductSchedule': 'dictionary', 'InstructorFullName': 'dictionary',
+    'InstructorEmail': 'dictionary', 'instructor_diploma': 'dictionary',
+    'Student': 'string',
+    'StudentBirthDate': 'timestamp[us]',
+    'SubscriptionStartDate': 'date32', 'SubscriptionEndDate': 'date32', 'DiplomaDate': 'date32',
+    'StartYear': 'int16', 'EndYear': 'int16', 'DiplomaYear': 'int16',
+    'StartMonth': 'int8', 'EndMonth': 'int8', 'DiplomaMonth': 'int8',
+    'StartDay': 'int8', 'EndDay': 'int8', 'DiplomaDay': 'int8',
+    'InstructorID': 'int32',
+    'SubscriptionHasDiploma': 'int8',
+}
+
+# File or directory name of the extract in a given format
+def output_name(base_name, output_format):
+    return os.path.splitext(base_name)[0] + FILE_EXTENSIONS[output_format]
+
+# Fail with a clear message when the optional pyarrow dependency is missing
+def require_pyarrow(output_format):
+    if pa is None:
+        raise RuntimeError(f"pyarrow is required for --output-format {output_format}")
+
+# Codec name for pyarrow (None for 'none'), after checking the format supports it
+def check_compression(output_format, compression):
+    if compression not in COMPRESSIONS[output_format]:
+        raise ValueError(f"Unknown {output_format} compression '{compression}', expected one of {', '.join(COMPRESSIONS[output_format])}")
+    return None if compression == 'none' else compression
+
+# Arrow table of the flattened extract with the column types of EXTRACT_TYPES
+def to_arrow(df):
+    arrays = []
+    for col in df.columns:
+        array = pa.array(df[col], from_pandas=True)
+        target = EXTRACT_TYPES.get(col)
+        if target == 'dictionary':
+            array = array.cast(pa.string()).dictionary_encode()
+        elif target is not None:
+            array = array.cast(pa.type_for_alias(target))
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=list(df.columns))
+
+# Dataset format and write options for write_dataset
+def file_format(output_format, compression):
+    if output_format == 'parquet':
+        parquet_format = ds.ParquetFileFormat()
+        return parquet_format, parquet_format.make_write_options(compression=compression)
+    ipc_format = ds.IpcFileFormat()
+    return ipc_format, ipc_format.make_write_options(compression=compression)
+
+# Write the flattened extract as one Parquet / Arrow IPC file, or as a dataset partitioned by
+# start year and month. A partitioned write only replaces the partitions present in df, so an
+# incremental run passes just the months it touched.
+def write_columnar(df, path, output_format='parquet', partitioned=False, compression='zstd'):
+    require_pyarrow(output_format)
+    compression = check_compression(output_format, compression)
+    table = to_arrow(df)
+    if not partitioned:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        if output_format == 'parquet':
+            pq.write_table(table, path, compression=compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            with pa.ipc.new_file(path, table.schema, options=options) as writer:
+                writer.write_table(table)
+        return
+    if os.path.isfile(path):
+        os.remove(path)
+    write_dataset_part(table, path, output_format, compression, 'part-{i}', 'delete_matching', partitioned=True)
+
+# One write_dataset call; basename is the file name template without its extension
+def write_dataset_part(table, path, output_format, compression, basename, existing_data_behavior, partitioned=True):
+    dataset_format, options = file_format(output_format, compression)
+    partitioning = ds.partitioning(table.select(PARTITION_COLUMNS).schema, flavor='hive') if partitioned else None
+    ds.write_dataset(table, path, format=dataset_format, file_options=options, partitioning=partitioning,
+                     basename_template=basename + FILE_EXTENSIONS[output_format],
+                     existing_data_behavior=existing_data_behavior)
+
+# Columnar writer for the streaming pipeline: every chunk becomes its own file (per partition)
+# in a dataset directory that is cleared when the writer is created
+class ChunkedColumnarWriter:
+    def __init__(self, path, output_format='parquet', partitioned=False, compression='zstd'):
+        require_pyarrow(output_format)
+        self.path = path
+        self.output_format = output_format
+        self.partitioned = partitioned
+        self.compression = check_compression(output_format, compression)
+        self.chunks = 0
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.isfile(path):
+            os.remove(path)
+
+    def write(self, df):
+        write_dataset_part(to_arrow(df), self.path, self.output_format, self.compression,
+                           f'part-{self.chunks:05d}-{{i}}', 'overwrite_or_ignore', partitioned=self.partitioned)
+        self.chunks += 1
+
+# Read an extract written by write_columnar / ChunkedColumnarWriter back into pandas
+def read_columnar(path, output_format='parquet'):
+    require_pyarrow(output_format)
+    dataset_format = 'parquet' if output_format == 'parquet' else 'ipc'
+    partitioning = 'hive' if os.path.isdir(path) else None
+    return ds.dataset(path, format=dataset_format, partitioning=partitioning).to_table().to_pandas()
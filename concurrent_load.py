@@ -0,0 +1,161 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from bulk_loader import LOADERS, DEFAULT_BATCH_SIZE, report_load
+from table_layout import create_partitions
+
+DEFAULT_LOAD_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 2
+
+# How long a blocked producer waits before checking whether the loads failed
+POLL_SECONDS = 0.5
+
+# Tables of metadata that are in names, grouped in levels: a table only references tables of
+# earlier levels (or tables that are not loaded), so the tables of one level can load together
+def load_levels(metadata, names):
+    pending = [table for table in metadata.sorted_tables if table.name in names]
+    levels, done = [], set()
+    while pending:
+        level = [table for table in pending
+                 if all(fk.column.table.name in done or fk.column.table.name not in names for fk in table.foreign_keys)]
+        levels.append(level)
+        done.update(table.name for table in level)
+        pending = [table for table in pending if table not in level]
+    return levels
+
+# Tables of names that no table of the metadata references (the facts of the star schema).
+# Decided over the whole metadata, not over one batch: a batch of dimensions alone must not
+# treat them as leaves, or the facts of the next batch could load before them.
+def leaf_tables(metadata, names):
+    referenced = {fk.column.table.name for table in metadata.sorted_tables for fk in table.foreign_keys}
+    return {name for name in names if name not in referenced}
+
+# The frames of a full load as batches: the dimensions first, then the facts in slices of rows,
+# so the slices load side by side over several connections
+def split_batches(metadata, frames, rows):
+    leaves = leaf_tables(metadata, frames)
+    yield {name: frame for name, frame in frames.items() if name not in leaves}
+    for name in leaves:
+        for start in range(0, len(frames[name]), rows):
+            yield {name: frames[name].iloc[start:start + rows]}
+
+# Loads batches of star schema frames over a pool of connections while the caller transforms
+# the next batch. A dispatcher thread takes the batches in order from a bounded queue, so a
+# producer that gets ahead of the database blocks instead of holding every batch in memory.
+# Within a batch, the tables of one level load concurrently and each level is committed before
+# the next one starts; facts are only waited for at the end (at most `workers` at a time), so
+# the dimensions of the next batch load while the facts of this one are still streaming in.
+# Foreign keys therefore always point at committed rows.
+class ConcurrentLoader:
+    def __init__(self, engine, metadata, loader='copy', batch_size=DEFAULT_BATCH_SIZE, copy_format='csv',
+                 workers=DEFAULT_LOAD_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+        # loader is a name of LOADERS or a function with the same signature
+        if not callable(loader) and loader not in LOADERS:
+            raise ValueError(f"Unknown loader '{loader}', expected one of {', '.join(LOADERS)}")
+        if workers < 1 or queue_size < 1:
+            raise ValueError(f"Load workers and queue size must be positive, got {workers} and {queue_size}")
+        self.engine = engine
+        self.metadata = metadata
+        self.load_frame = loader if callable(loader) else LOADERS[loader]
+        self.loader = getattr(loader, '__name__', loader)
+        self.options = {'batch_size': batch_size, 'copy_format': copy_format}
+        self.workers = workers
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='load')
+        self.pending_leaves = deque()
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.error = None
+        self.closed = False
+        self.dispatcher = threading.Thread(target=self.dispatch, name='load-dispatcher', daemon=True)
+        self.dispatcher.start()
+
+    # Load one frame into one table on a pooled connection and add up its rows and time
+    def load(self, table, frame):
+        started = time.perf_counter()
+        self.load_frame(self.engine, table, frame, **self.options)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            rows, seconds = self.totals.get(table.name, (0, 0.0))
+            self.totals[table.name] = (rows + len(frame), seconds + elapsed)
+
+    # Dispatcher thread: schedule every queued batch level by level until the closing None
+    def dispatch(self):
+        while True:
+            frames = self.batches.get()
+            if frames is None:
+                return
+            if self.error is not None:
+                continue  # Drain the queue so a blocked producer wakes up and sees the error
+            try:
+                self.schedule(frames)
+            except Exception as e:
+                self.error = e
+
+    # Load the tables of one batch level by level; facts are submitted without waiting for them
+    def schedule(self, frames):
+        frames = {name: frame for name, frame in frames.items() if frame is not None and not frame.empty}
+        leaves = leaf_tables(self.metadata, frames)
+        for level in load_levels(self.metadata, frames):
+            futures = []
+            for table in level:
+                # Partitions are created here, one table at a time, so concurrent loads never race on the DDL
+                create_partitions(self.engine, table, frames[table.name])
+                if table.name in leaves:
+                    self.wait_for_leaves(self.workers - 1)
+                    self.pending_leaves.append(self.pool.submit(self.load, table, frames[table.name]))
+                else:
+                    futures.append(self.pool.submit(self.load, table, frames[table.name]))
+            for future in futures:
+                future.result()
+
+    # Block until at most limit fact loads are outstanding, raising the first failure
+    def wait_for_leaves(self, limit):
+        while len(self.pending_leaves) > limit:
+            self.pending_leaves.popleft().result()
+
+    # Queue a batch (table name -> DataFrame); blocks while the queue is full
+    def submit(self, frames):
+        if self.closed:
+            raise RuntimeError("Cannot submit to a closed loader")
+        while True:
+            if self.error is not None:
+                raise RuntimeError(f"Concurrent load failed: {self.error}")
+            try:
+                self.batches.put(frames, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    # Wait for every queued batch to be loaded and return the totals per table (report_load)
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.batches.put(None)
+            self.dispatcher.join()
+            try:
+                if self.error is None:
+                    self.wait_for_leaves(0)
+            except Exception as e:
+                self.error = e
+            finally:
+                wait(self.pending_leaves)
+                self.pool.shutdown(wait=True)
+        if self.error is not None:
+            raise RuntimeError(f"Concurrent load failed: {self.error}")
+        return [report_load(table.name, self.loader, *self.totals[table.name])
+                for table in self.metadata.sorted_tables if table.name in self.totals]
+
+# Concurrent counterpart of streaming_pipeline.load_stream: batches are produced (transformed) in
+# the calling thread while the earlier ones load through concurrent (a ConcurrentLoader, which
+# may already hold batches submitted earlier)
+def load_batches(concurrent, batches):
+    try:
+        for frames in batches:
+            concurrent.submit(frames)
+    finally:
+        stats = concurrent.close()
+    return stats
@@ -0,0 +1,86 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from cleaning import DATE_COLUMNS, NULL_DATE_STRINGS, detect_date_formats
+
+# How many unparseable values are shown per column in the report
+REPORT_SAMPLES = 5
+
+# Parses the date columns of the extract. Each distinct string is parsed once with the format
+# detected for its column and memoized per format, so columns sharing a format and later chunks
+# reuse it; rows get their dates back through the factorized codes. Strings the column format
+# cannot read are parsed with their own inferred format (DiplomaDate mixes 2/11/2024 and ISO
+# dates), and those no format can read are counted for the report before becoming NaT.
+class DateParser:
+    def __init__(self, date_formats=None):
+        self.date_formats = dict(date_formats or {})
+        self.cache = {}
+        self.unparseable = {col: Counter() for col in DATE_COLUMNS}
+        self.other_formats = Counter()
+
+    # Formats of the columns not seen yet, taken from the first value of this frame
+    def detect(self, df):
+        for col, date_format in detect_date_formats(df).items():
+            self.date_formats.setdefault(col, date_format)
+
+    # Parse the distinct strings that are not cached yet. Strings the column format misses are
+    # parsed in groups: the format of the first one is inferred and tried on all the others.
+    def parse_unique(self, col, date_format, values):
+        parsed = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', format=date_format)
+        parsed = parsed.to_numpy(dtype='datetime64[us]', copy=True)
+        pending = [i for i in np.flatnonzero(np.isnat(parsed))
+                   if isinstance(values[i], str) and values[i].strip() not in NULL_DATE_STRINGS]
+        tried = {date_format}
+        while pending:
+            value_format = guess_datetime_format(values[pending[0]].strip())
+            if value_format in tried:
+                pending = pending[1:]
+                continue
+            tried.add(value_format)
+            retry = pd.to_datetime(pd.Series([values[i].strip() for i in pending], dtype=object),
+                                   errors='coerce', format=value_format).to_numpy(dtype='datetime64[us]')
+            for i, value in zip(pending, retry):
+                parsed[i] = value
+            if (~np.isnat(retry)).any():
+                self.other_formats[col] += int((~np.isnat(retry)).sum())
+            pending = [i for i, value in zip(pending, retry) if np.isnat(value)]
+        return parsed
+
+    # Dates of one column (datetime64[us], NaT where missing or unparseable)
+    def parse(self, values, col):
+        date_format = self.date_formats.get(col)
+        codes, uniques = pd.factorize(values)
+        uniques = list(uniques)
+        cache = self.cache.setdefault(date_format, {})
+        new = [value for value in uniques if value not in cache]
+        if new:
+            cache.update(zip(new, self.parse_unique(col, date_format, new)))
+        lookup = np.array([cache[value] for value in uniques] + [np.datetime64('NaT')], dtype='datetime64[us]')
+        failed = np.flatnonzero(np.isnat(lookup[:-1]))
+        if len(failed):
+            rows = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            for i in failed:
+                self.unparseable[col][uniques[i]] += int(rows[i])
+        return pd.Series(lookup[codes], index=values.index, name=values.name)
+
+    # Convert the date columns of df in place, detecting the formats of columns not seen yet
+    def parse_frame(self, df):
+        self.detect(df)
+        for col in DATE_COLUMNS:
+            df[col] = self.parse(df[col], col)
+        return df
+
+    # Print the columns whose strings needed another format or could not be parsed; the
+    # counts start over afterwards
+    def report(self):
+        for col, count in self.other_formats.items():
+            print(f"{col}: {count} distinct values parsed with another format than {self.date_formats.get(col)}")
+        for col, values in self.unparseable.items():
+            if values:
+                samples = ', '.join(repr(value) for value, _ in values.most_common(REPORT_SAMPLES))
+                print(f"Warning: {sum(values.values())} {col} values could not be parsed and will be imputed ({samples})")
+        self.unparseable = {col: Counter() for col in DATE_COLUMNS}
+        self.other_formats = Counter()
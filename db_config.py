@@ -0,0 +1,27 @@
+import os
+
+from sqlalchemy import create_engine
+
+# Settings every entry point reads from the environment / .env file
+REQUIRED_SETTINGS = ['DB_USER', 'DB_PASSWORD', 'DB_HOST', 'DB_PORT', 'DB_NAME', 'SCHEMA']
+
+# Configuration validation
+def validate_config():
+    config = {key: os.getenv(key) for key in REQUIRED_SETTINGS}
+    missing = [key for key, value in config.items() if value is None]
+    if missing:
+        raise ValueError(f"Missing environment variables: {', '.join(missing)}")
+    config['DB_PORT'] = int(config['DB_PORT'])  # Convert to integer
+    return config
+
+# SQLAlchemy URL of the configured database
+def engine_url(config):
+    return (f"postgresql+psycopg2://{config['DB_USER']}:{config['DB_PASSWORD']}@{config['DB_HOST']}:"
+            f"{config['DB_PORT']}/{config['DB_NAME']}?client_encoding=utf8")
+
+# Create database engine
+def get_engine(config, **options):
+    try:
+        return create_engine(engine_url(config), **options)
+    except Exception as e:
+        raise ConnectionError(f"Failed to create database engine: {e}")
@@ -1,227 +1,464 @@
 import os
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float, DateTime, Boolean, ForeignKey
 from sqlalchemy.sql import text
 import argparse
 import sys
+from db_config import validate_config, get_engine
+from bulk_loader import LOADERS, COPY_FORMATS, DEFAULT_BATCH_SIZE, load_tables, create_tables_without_foreign_keys, add_foreign_keys, create_indexes
+from table_layout import analyze_tables
+from kpi_aggregates import declare_aggregates, refresh_aggregates
+from instrumentation import METRICS_FORMATS, StageRecorder
+from flattened_view import create_flattened_view
+from star_schema import NATURAL_KEYS, COURSE_OFFERING_KEY, DIMENSION_COLUMNS, build_metadata
+from key_resolution import KeyIndex, dimension_members
+from parallel_ingest import is_multi_input, expand_inputs, transform_files, merge_partials, file_watermarks
+from date_parsing import DateParser
+from calendar_dimension import date_keys, calendar_range, build_calendar
+from cleaning import detect_encoding, read_subscriptions, validate_columns, apply_fills
+from fill_statistics import FillStatistics, merge_fill_statistics, read_fill_statistics, save_fill_statistics
+from streaming_pipeline import DEFAULT_CHUNK_SIZE, scan_subscriptions, stream_star_schema, stream_watermark, load_stream
+from concurrent_load import DEFAULT_LOAD_WORKERS, DEFAULT_QUEUE_SIZE, ConcurrentLoader, split_batches, load_batches
+from stage_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_MB, CLEANING_MODULES, STAR_SCHEMA_MODULES, StageCache, code_digest
+from incremental_load import MODES, watermark_identity, read_watermark, select_new_rows, next_watermark, save_watermark, load_incremental
 
-# Load environment variables from .env file
-load_dotenv()
+# Command-line arguments shared by the entry points; run_pipeline takes the same options as
+# keyword arguments
+def add_pipeline_arguments(parser):
+    parser.add_argument('--csv-path', type=str, help="Path to the CSV file, or a directory / glob of extracts loaded together", default='Functional Task - OLTP_Subscription.csv')
+    parser.add_argument('--workers', type=int, help="Worker processes parsing a directory / glob of extracts (default: one per CPU)")
+    parser.add_argument('--loader', choices=sorted(LOADERS), default='copy', help="How tables are loaded: COPY FROM STDIN or pandas to_sql")
+    parser.add_argument('--copy-format', choices=COPY_FORMATS, default='csv', help="Buffer format used by the COPY loader")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Rows per COPY/INSERT batch")
+    parser.add_argument('--defer-fks', action='store_true', help="Create foreign keys and indexes after the bulk load instead of with the tables")
+    parser.add_argument('--partition-facts', action='store_true', help="Range-partition fact_subscription by start date (one partition per year); incremental runs must match the existing schema")
+    parser.add_argument('--mode', choices=MODES, default='full', help="full: rebuild the schema; incremental: upsert dimensions and append only new subscriptions (always uses COPY)")
+    parser.add_argument('--calendar-start', type=str, help="Widen the dim_time calendar back to the year of this day (YYYY-MM-DD); the calendar spans whole years and always covers every subscription date")
+    parser.add_argument('--calendar-end', type=str, help="Widen the dim_time calendar up to the year of this day (YYYY-MM-DD); the calendar spans whole years and always covers every subscription date")
+    parser.add_argument('--streaming', action='store_true', help="Read, clean and load the CSV in chunks with bounded memory")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per chunk in streaming mode, and per fact batch with --concurrent-load")
+    parser.add_argument('--concurrent-load', action='store_true', help="Load independent tables and fact batches concurrently over pooled connections, overlapping the transform")
+    parser.add_argument('--load-workers', type=int, default=DEFAULT_LOAD_WORKERS, help="Connections loading at the same time with --concurrent-load")
+    parser.add_argument('--load-queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help="Transformed batches waiting for the database before the transform blocks (--concurrent-load)")
+    parser.add_argument('--cache', action='store_true', help="Reuse the cleaned rows and star schema tables of an earlier run on the same input, options and code")
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, help="Directory of the --cache entries")
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_MB, help="Size the --cache directory is kept under by evicting the least recently used entries")
+    parser.add_argument('--metrics-file', type=str, help="Write per-stage metrics (wall/CPU time, peak memory, rows) to this file")
+    parser.add_argument('--metrics-format', choices=METRICS_FORMATS, default='jsonl', help="JSON lines (appended) or a Prometheus textfile")
+    parser.add_argument('--profile', action='store_true', help="Run every stage under cProfile and tracemalloc and write the reports to --profile-dir")
+    parser.add_argument('--profile-dir', type=str, default='profiles', help="Directory for the --profile reports")
 
-# Configuration validation
-def validate_config():
-    required = ['DB_USER', 'DB_PASSWORD', 'DB_HOST', 'DB_PORT', 'DB_NAME', 'SCHEMA']
-    config = {key: os.getenv(key) for key in required}
-    missing = [key for key, value in config.items() if value is None]
-    if missing:
-        raise ValueError(f"Missing environment variables: {', '.join(missing)}")
-    config['DB_PORT'] = int(config['DB_PORT'])  # Convert to integer
-    return config
-
-# Parse command-line arguments
 parser = argparse.ArgumentParser(description="ETL Pipeline for GoMyCode DataOps Task")
-parser.add_argument('--csv-path', type=str, help="Path to the CSV file", default='Functional Task - OLTP_Subscription.csv')
-args = parser.parse_args()
-
-# Configuration from environment variables
-config = validate_config()
-DB_USER = config['DB_USER']
-DB_PASSWORD = config['DB_PASSWORD']
-DB_HOST = config['DB_HOST']
-DB_PORT = config['DB_PORT']
-DB_NAME = config['DB_NAME']
-SCHEMA = config['SCHEMA']
-
-# CSV file path
+add_pipeline_arguments(parser)
+
+# Message for the first combination of options that does not work together, None when they all do
+def option_error(args):
+    if args.streaming and args.mode == 'incremental':
+        return "--streaming is only supported with --mode full"
+    if args.concurrent_load and args.mode == 'incremental':
+        return "--concurrent-load is only supported with --mode full"
+    if args.cache and (args.streaming or args.mode == 'incremental' or is_multi_input(args.csv_path)):
+        return "--cache is only supported for a single CSV with --mode full, without --streaming"
+    if is_multi_input(args.csv_path) and (args.streaming or args.mode == 'incremental'):
+        return "A directory or glob --csv-path is only supported with --mode full, without --streaming"
+    return None
+
 script_dir = os.path.dirname(os.path.abspath(__file__))
-CSV_FILE = os.path.join(script_dir, args.csv_path) if args.csv_path else os.path.join(script_dir, 'Functional Task - OLTP_Subscription.csv')
 
-# Create database engine
-def get_engine():
-    try:
-        engine_url = f'postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?client_encoding=utf8'
-        return create_engine(engine_url)
-    except Exception as e:
-        raise ConnectionError(f"Failed to create database engine: {e}")
+# Options of a run: the defaults of parser overridden by options (keyword form of the
+# command-line options); source, when given, replaces --csv-path
+def run_options(parser, source=None, **options):
+    defaults = vars(parser.parse_args([]))
+    unknown = sorted(set(options) - set(defaults))
+    if unknown:
+        raise ValueError(f"Unknown pipeline options: {', '.join(unknown)}")
+    run_args = argparse.Namespace(**{**defaults, **options})
+    if source is not None:
+        run_args.csv_path = source
+    return run_args
 
 # Drop and recreate schema
-def reset_schema(engine):
+def reset_schema(engine, schema):
     try:
         with engine.connect() as connection:
-            connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;"))
-            connection.execute(text(f"CREATE SCHEMA {SCHEMA};"))
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE;"))
+            connection.execute(text(f"CREATE SCHEMA {schema};"))
             connection.commit()
         print("Schema reset successfully.")
     except Exception as e:
         raise RuntimeError(f"Schema reset failed: {e}")
 
+# Create the schema if needed, keeping existing tables and data
+def ensure_schema(engine, schema):
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema};"))
+    except Exception as e:
+        raise RuntimeError(f"Schema creation failed: {e}")
+
 # Define and create tables
-def create_tables(engine):
-    metadata = MetaData(schema=SCHEMA)
-    
-    # Dimension Tables
-    Table('dim_student', metadata,
-          Column('StudentID', Integer, primary_key=True),
-          Column('Student', String),
-          Column('StudentGender', String),
-          Column('StudentBirthDate', DateTime),
-          Column('professionalExperience', Integer),
-          Column('Industry', String))
-    
-    Table('dim_instructor', metadata,
-          Column('InstructorID', Integer, primary_key=True),
-          Column('InstructorFullName', String),
-          Column('InstructorEmail', String),
-          Column('instructor_diploma', String))
-    
-    Table('dim_course_offering', metadata,
-          Column('CourseOfferingID', Integer, primary_key=True),
-          Column('GroupName', String),
-          Column('SessionName', String),
-          Column('TrackName', String),
-          Column('Hackerspace', String),
-          Column('Country', String),
-          Column('ProductSchedule', String),
-          Column('InstructorID', Integer, ForeignKey(f'{SCHEMA}.dim_instructor.InstructorID')))
-    
-    Table('dim_time', metadata,
-          Column('TimeID', Integer, primary_key=True),
-          Column('Date', DateTime),
-          Column('Year', Integer),
-          Column('Month', Integer),
-          Column('Day', Integer))
-    
-    # Fact Table
-    Table('fact_subscription', metadata,
-          Column('SubscriptionID', Integer, primary_key=True),
-          Column('CourseOfferingID', Integer, ForeignKey(f'{SCHEMA}.dim_course_offering.CourseOfferingID')),
-          Column('StudentID', Integer, ForeignKey(f'{SCHEMA}.dim_student.StudentID')),
-          Column('StartTimeID', Integer, ForeignKey(f'{SCHEMA}.dim_time.TimeID')),
-          Column('EndTimeID', Integer, ForeignKey(f'{SCHEMA}.dim_time.TimeID')),
-          Column('DiplomaTimeID', Integer, ForeignKey(f'{SCHEMA}.dim_time.TimeID')),
-          Column('SubscriptionProgress', Float),  # Stored as 0 to 1
-          Column('SubscriptionHasDiploma', Integer))  # Stored as 0 or 1
-    
+def create_tables(engine, schema, defer_foreign_keys=False, partition_facts=False):
+    metadata = build_metadata(schema, partition_facts=partition_facts)
+    declare_aggregates(metadata)
+
     try:
-        metadata.create_all(engine)
+        if defer_foreign_keys:
+            create_tables_without_foreign_keys(engine, metadata)
+        else:
+            metadata.create_all(engine)
+        with engine.begin() as connection:
+            create_flattened_view(connection, metadata)
         print("Tables created successfully.")
     except Exception as e:
         raise RuntimeError(f"Table creation failed: {e}")
+    return metadata
 
-# Process the CSV and load data
-def process_csv():
-    engine = get_engine()
-    reset_schema(engine)
-    create_tables(engine)
-    
-    # Extract
-    if not os.path.exists(CSV_FILE):
-        raise FileNotFoundError(f"Error: CSV file {CSV_FILE} not found.")
-    
-    try:
-        df = pd.read_csv(CSV_FILE, encoding='utf-8-sig')
-    except UnicodeDecodeError:
-        df = pd.read_csv(CSV_FILE, encoding='cp1252')
-    except Exception as e:
-        raise RuntimeError(f"Failed to read CSV: {e}")
-    
-    # Validate required columns
-    required_columns = ['Student', 'InstructorFullName', 'GroupName', 'SubscriptionStartDate', 'SubscriptionProgress', 'SubscriptionHasDiploma']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    if missing_columns:
-        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
-    
-    # Clean data: handle missing values with mean/median/mode
-    try:
-        # Numerical: Use median for professionalExperience
-        df['professionalExperience'] = df['professionalExperience'].fillna(df['professionalExperience'].median())
-        
-        # Categorical: Use mode for StudentGender and Industry
-        df['StudentGender'] = df['StudentGender'].fillna(df['StudentGender'].mode()[0])
-        df['Industry'] = df['Industry'].fillna(df['Industry'].mode()[0])
-        
-        # Dates: Convert to datetime and fill with median date
-        date_columns = ['StudentBirthDate', 'SubscriptionStartDate', 'SubscriptionEndDate', 'DiplomaDate']
-        for col in date_columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
-            median_date = df[col].median()
-            df[col] = df[col].fillna(median_date)
-        
-        # Transform SubscriptionProgress to 0-1 range
-        df['SubscriptionProgress'] = df['SubscriptionProgress'].fillna('0%').str.rstrip('%').astype(float) / 100.0
-        
-        # Debug: Check raw values
-        print("Raw SubscriptionHasDiploma values:", df['SubscriptionHasDiploma'].head())
-        
-        # Transform SubscriptionHasDiploma to 0 or 1 (handling True/False), ensure integer type and handle nulls
-        df['SubscriptionHasDiploma'] = df['SubscriptionHasDiploma'].fillna(False).astype(int)
-        
-        # Debug: Check transformed values
-        print("Transformed SubscriptionHasDiploma values:", df['SubscriptionHasDiploma'].head())
-    except Exception as e:
-        raise ValueError(f"Data cleaning failed: {e}")
+# One run of the pipeline and its state: options, per-stage metrics, database configuration,
+# target schema and input path. Every run gets its own instance, so runs share no module state.
+# The export entry point subclasses it and hooks in through stream_load and export.
+class EtlPipeline:
+    def __init__(self, options, config):
+        self.args = options
+        # Per-stage metrics of this run
+        self.recorder = StageRecorder(profile=options.profile, profile_dir=options.profile_dir)
+        self.config = config
+        self.schema = config['SCHEMA']
+        # CSV file path
+        self.csv_file = os.path.join(script_dir, options.csv_path) if options.csv_path else os.path.join(script_dir, 'Functional Task - OLTP_Subscription.csv')
 
-    # Transform
-    try:
-        # Dim Instructor
-        dim_instructor = df[['InstructorFullName', 'InstructorEmail', 'instructor_diploma']].drop_duplicates().reset_index(drop=True)
-        dim_instructor['InstructorID'] = dim_instructor.index + 1
-        
-        # Dim Course Offering
-        course_offering_key = ['GroupName', 'SessionName', 'TrackName', 'Hackerspace', 'Country', 'ProductSchedule']
-        dim_course_offering = df[course_offering_key + ['InstructorFullName', 'InstructorEmail']].drop_duplicates().reset_index(drop=True)
-        dim_course_offering = dim_course_offering.merge(dim_instructor[['InstructorFullName', 'InstructorEmail', 'InstructorID']], 
-                                                      on=['InstructorFullName', 'InstructorEmail'], how='left')
-        dim_course_offering = dim_course_offering[course_offering_key + ['InstructorID']].reset_index(drop=True)
-        dim_course_offering['CourseOfferingID'] = dim_course_offering.index + 1
-        
-        # Dim Student
-        dim_student = df[['Student', 'StudentGender', 'StudentBirthDate', 'professionalExperience', 'Industry']].drop_duplicates().reset_index(drop=True)
-        dim_student['StudentID'] = dim_student.index + 1
-        
-        # Dim Time
-        dates = pd.concat([df['SubscriptionStartDate'], df['SubscriptionEndDate'], df['DiplomaDate']]).dropna().unique()
-        dim_time = pd.DataFrame({'Date': pd.to_datetime(dates, errors='coerce')})
-        dim_time['TimeID'] = dim_time.index + 1
-        dim_time['Year'] = dim_time['Date'].dt.year
-        dim_time['Month'] = dim_time['Date'].dt.month
-        dim_time['Day'] = dim_time['Date'].dt.day
-        
-        # Fact Subscription
-        fact_subscription = df[['GroupName', 'Student', 'SubscriptionStartDate', 'SubscriptionEndDate', 'DiplomaDate', 
-                              'SubscriptionProgress', 'SubscriptionHasDiploma']]
-        fact_subscription = fact_subscription.merge(dim_course_offering[['GroupName', 'CourseOfferingID']], on='GroupName', how='left')
-        fact_subscription = fact_subscription.merge(dim_student[['Student', 'StudentID']], on='Student', how='left')
-        
-        fact_subscription['SubscriptionStartDate'] = pd.to_datetime(fact_subscription['SubscriptionStartDate'], errors='coerce')
-        fact_subscription['SubscriptionEndDate'] = pd.to_datetime(fact_subscription['SubscriptionEndDate'], errors='coerce')
-        fact_subscription['DiplomaDate'] = pd.to_datetime(fact_subscription['DiplomaDate'], errors='coerce')
-        fact_subscription = fact_subscription.merge(dim_time[['Date', 'TimeID']], left_on='SubscriptionStartDate', right_on='Date', how='left').rename(columns={'TimeID': 'StartTimeID'}).drop('Date', axis=1)
-        fact_subscription = fact_subscription.merge(dim_time[['Date', 'TimeID']], left_on='SubscriptionEndDate', right_on='Date', how='left').rename(columns={'TimeID': 'EndTimeID'}).drop('Date', axis=1)
-        fact_subscription = fact_subscription.merge(dim_time[['Date', 'TimeID']], left_on='DiplomaDate', right_on='Date', how='left').rename(columns={'TimeID': 'DiplomaTimeID'}).drop('Date', axis=1)
-        
-        fact_subscription['SubscriptionID'] = fact_subscription.index + 1
-        fact_subscription = fact_subscription[['SubscriptionID', 'CourseOfferingID', 'StudentID', 'StartTimeID', 'EndTimeID', 'DiplomaTimeID', 'SubscriptionProgress', 'SubscriptionHasDiploma']]
-    except Exception as e:
-        raise RuntimeError(f"Data transformation failed: {e}")
+    # Process the CSV, then write the metrics whether or not it succeeded; returns the stage records
+    def run(self, engine=None):
+        try:
+            self.process_csv(engine)
+        finally:
+            if self.args.metrics_file:
+                self.recorder.write(self.args.metrics_file, self.args.metrics_format)
+        return self.recorder.records
 
+    # Loader of --concurrent-load: a pool of connections fed with batches of frames through a bounded queue
+    def concurrent_loader(self, engine, metadata):
+        args = self.args
+        return ConcurrentLoader(engine, metadata, loader=args.loader, batch_size=args.batch_size, copy_format=args.copy_format,
+                                workers=args.load_workers, queue_size=args.load_queue_size)
+
+    # Load the batches of the streaming pipeline chunk after chunk, or with --concurrent-load while
+    # the next chunks are transformed
+    def stream_batches(self, engine, metadata, batches):
+        args = self.args
+        if args.concurrent_load:
+            return load_batches(self.concurrent_loader(engine, metadata), batches)
+        return load_stream(engine, metadata, batches, loader=args.loader, batch_size=args.batch_size, copy_format=args.copy_format)
+
+    # Extract, validate and clean the CSV. Returns the cleaned rows (only the new ones in
+    # incremental mode, None when there are none), the watermark of the file and the imputation
+    # sketches to store with the load.
+    def extract_clean(self, engine, metadata):
+        args, recorder = self.args, self.recorder
+        with recorder.stage('extract') as stage:
+            try:
+                df = read_subscriptions(self.csv_file, detect_encoding(self.csv_file))
+            except Exception as e:
+                raise RuntimeError(f"Failed to read CSV: {e}")
+            stage['rows'] = len(df)
+
+        # Validate required columns
+        validate_columns(df.columns)
+
+        # Keep only rows past the stored watermark in incremental mode
+        with recorder.stage('watermark') as stage:
+            previous_watermark = read_watermark(engine, metadata, self.csv_file)
+            watermark = next_watermark(watermark_identity(self.csv_file, len(df)), df, previous_watermark)
+            if args.mode == 'incremental':
+                df = select_new_rows(df, previous_watermark)
+            stage['rows'] = len(df)
+        if args.mode == 'incremental':
+            if df.empty:
+                print(f"No new subscriptions in {self.csv_file} since the last run.")
+                return None, watermark, None
+            print(f"Incremental run: {len(df)} new rows in {self.csv_file}.")
+
+        # Clean data: handle missing values with median/mode
+        try:
+            # Dates: each distinct string parsed once with its column's format, then impute medians/modes
+            with recorder.stage('parse_dates', rows=len(df)):
+                date_parser = DateParser()
+                date_parser.parse_frame(df)
+                date_parser.report()
+            with recorder.stage('impute', rows=len(df)) as stage:
+                # Incremental runs merge the sketches of every row loaded before, so the new rows
+                # are filled from the whole history rather than from this batch alone
+                statistics = FillStatistics.from_frame(df)
+                if args.mode == 'incremental':
+                    statistics = read_fill_statistics(engine, metadata).merge(statistics)
+                apply_fills(df, statistics.fill_values())
+                stage['diplomas'] = int(df['SubscriptionHasDiploma'].sum())
+        except Exception as e:
+            raise ValueError(f"Data cleaning failed: {e}")
+        return df, watermark, statistics
+
+    # Transform: one member per natural key, fact keys resolved through hash indexes on those keys.
+    # With --concurrent-load the dimensions already load while the fact keys are resolved; the
+    # loader is returned with the tables.
+    def build_tables(self, engine, metadata, df):
+        args, recorder = self.args, self.recorder
+        concurrent = None
+        try:
+            with recorder.stage('dimensions') as stage:
+                # Dim Instructor
+                dim_instructor = dimension_members(df, DIMENSION_COLUMNS['dim_instructor'], NATURAL_KEYS['dim_instructor'], 'dim_instructor')
+                dim_instructor['InstructorID'] = dim_instructor.index + 1
+                instructor_index = KeyIndex(dim_instructor, NATURAL_KEYS['dim_instructor'], 'InstructorID')
+
+                # Dim Course Offering
+                dim_course_offering = dimension_members(df, COURSE_OFFERING_KEY + ['InstructorFullName', 'InstructorEmail'], COURSE_OFFERING_KEY, 'dim_course_offering')
+                dim_course_offering['InstructorID'] = instructor_index.resolve(dim_course_offering)
+                dim_course_offering = dim_course_offering[COURSE_OFFERING_KEY + ['InstructorID']]
+                dim_course_offering['CourseOfferingID'] = dim_course_offering.index + 1
+
+                # Dim Student
+                dim_student = dimension_members(df, DIMENSION_COLUMNS['dim_student'], NATURAL_KEYS['dim_student'], 'dim_student')
+                dim_student['StudentID'] = dim_student.index + 1
+
+                # Dim Time: generated calendar covering every subscription date, keyed by YYYYMMDD
+                fact_dates = [df['SubscriptionStartDate'], df['SubscriptionEndDate'], df['DiplomaDate']]
+                dim_time = build_calendar(*calendar_range(fact_dates, args.calendar_start, args.calendar_end))
+                stage['rows'] = len(dim_instructor) + len(dim_course_offering) + len(dim_student) + len(dim_time)
+
+            # With --concurrent-load the dimensions already load while the fact keys are resolved
+            if args.concurrent_load:
+                concurrent = self.concurrent_loader(engine, metadata)
+                concurrent.submit({'dim_student': dim_student, 'dim_instructor': dim_instructor,
+                                   'dim_course_offering': dim_course_offering, 'dim_time': dim_time})
+
+            with recorder.stage('key_resolution') as stage:
+                # Fact Subscription: one row per subscription, every foreign key resolved in a single pass
+                course_offering_index = KeyIndex(dim_course_offering, COURSE_OFFERING_KEY, 'CourseOfferingID')
+                student_index = KeyIndex(dim_student, NATURAL_KEYS['dim_student'], 'StudentID')
+                fact_subscription = pd.DataFrame({
+                    'SubscriptionID': np.arange(1, len(df) + 1),
+                    'CourseOfferingID': course_offering_index.resolve(df),
+                    'StudentID': student_index.resolve(df),
+                    'StartTimeID': date_keys(df['SubscriptionStartDate']),
+                    'EndTimeID': date_keys(df['SubscriptionEndDate']),
+                    'DiplomaTimeID': date_keys(df['DiplomaDate']),
+                    'SubscriptionProgress': df['SubscriptionProgress'].to_numpy(),
+                    'SubscriptionHasDiploma': df['SubscriptionHasDiploma'].to_numpy(),
+                })
+                stage['rows'] = len(fact_subscription)
+        except Exception as e:
+            if concurrent is not None:
+                # Wait for the dimensions already handed to the loader, so its threads and
+                # connections are released before the error propagates
+                try:
+                    concurrent.close()
+                except Exception as close_error:
+                    print(f"Concurrent load of the dimensions failed as well: {close_error}")
+            raise RuntimeError(f"Data transformation failed: {e}")
+        frames = {
+            'dim_student': dim_student,
+            'dim_instructor': dim_instructor,
+            'dim_course_offering': dim_course_offering,
+            'dim_time': dim_time,
+            'fact_subscription': fact_subscription,
+        }
+        return frames, concurrent
+
+    # Cleaned rows and star schema tables of the CSV. With --cache they come from the stage cache
+    # when the input file, the transform options and the transform code are unchanged; the cleaned
+    # rows alone are reused when only the calendar options changed.
+    def transform_csv(self, engine, metadata):
+        args, recorder = self.args, self.recorder
+        if not args.cache:
+            df, watermark, statistics = self.extract_clean(engine, metadata)
+            return (None, None, watermark, statistics) if df is None else (*self.build_tables(engine, metadata, df), watermark, statistics)
+
+        with recorder.stage('cache_lookup') as stage:
+            cache = StageCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+            cleaned_key = cache.key(cache.file_digest(self.csv_file), code_digest(CLEANING_MODULES, [EtlPipeline.extract_clean]))
+            tables_key = cache.key(cleaned_key, args.calendar_start, args.calendar_end,
+                                   code_digest(STAR_SCHEMA_MODULES, [EtlPipeline.build_tables]))
+            cached = cache.get(tables_key)
+            stage['hit'] = 'tables' if cached else None
+            if cached is None:
+                cleaned = cache.get(cleaned_key)
+                stage['hit'] = 'cleaned' if cleaned else None
+        if cached:
+            frames, details = cached
+            print(f"Reusing the cached star schema tables of {self.csv_file} ({tables_key})")
+            return frames, None, details['watermark'], FillStatistics.from_state(details['fill_statistics'])
+
+        if cleaned:
+            print(f"Reusing the cached cleaned rows of {self.csv_file} ({cleaned_key})")
+            df, watermark = cleaned[0]['cleaned'], cleaned[1]['watermark']
+            statistics = FillStatistics.from_state(cleaned[1]['fill_statistics'])
+        else:
+            df, watermark, statistics = self.extract_clean(engine, metadata)
+            with recorder.stage('cache_store_cleaned', rows=len(df)):
+                cache.put(cleaned_key, {'cleaned': df}, {'watermark': watermark, 'fill_statistics': statistics.to_state()})
+        frames, concurrent = self.build_tables(engine, metadata, df)
+        with recorder.stage('cache_store_tables', rows=sum(len(frame) for frame in frames.values())):
+            cache.put(tables_key, frames, {'watermark': watermark, 'fill_statistics': statistics.to_state()})
+        return frames, concurrent, watermark, statistics
+
+    # Foreign keys and indexes created after the bulk load with --defer-fks
+    def add_constraints(self, engine, metadata):
+        if self.args.defer_fks:
+            with self.recorder.stage('constraints'):
+                add_foreign_keys(engine, metadata)
+                create_indexes(engine, metadata)
+
+    # Process the CSV and load data
+    def process_csv(self, engine=None):
+        args, recorder = self.args, self.recorder
+        # One pooled connection per load worker, plus the one the pipeline itself holds
+        engine = engine or get_engine(self.config, pool_size=max(5, args.load_workers + 1))
+        with recorder.stage('schema'):
+            if args.mode == 'incremental':
+                ensure_schema(engine, self.schema)
+                metadata = create_tables(engine, self.schema, partition_facts=args.partition_facts)
+            else:
+                reset_schema(engine, self.schema)
+                metadata = create_tables(engine, self.schema, defer_foreign_keys=args.defer_fks, partition_facts=args.partition_facts)
+
+        # Extract
+        if is_multi_input(self.csv_file):
+            self.process_csv_files(engine, metadata)
+            return
+        if not os.path.exists(self.csv_file):
+            raise FileNotFoundError(f"Error: CSV file {self.csv_file} not found.")
+
+        if args.streaming:
+            self.process_csv_streaming(engine, metadata)
+            return
+
+        frames, concurrent, watermark, statistics = self.transform_csv(engine, metadata)
+        if frames is None:
+            return
+
+        # Load data with the selected loader (COPY FROM STDIN by default), dimensions before facts
+        try:
+            fact_subscription = frames['fact_subscription']
+            if args.mode == 'incremental':
+                with recorder.stage('load', rows=len(fact_subscription)):
+                    load_incremental(engine, metadata, frames, watermark, batch_size=args.batch_size, copy_format=args.copy_format,
+                                     fill_statistics=statistics)
+            else:
+                with recorder.stage('load', rows=sum(len(frame) for frame in frames.values())):
+                    if args.concurrent_load:
+                        # Dimensions the transform already handed to the loader are not loaded twice
+                        pending = {'fact_subscription': fact_subscription} if concurrent else frames
+                        stats = load_batches(concurrent or self.concurrent_loader(engine, metadata), split_batches(metadata, pending, args.chunk_size))
+                    else:
+                        stats = load_tables(engine, metadata, frames, loader=args.loader, batch_size=args.batch_size, copy_format=args.copy_format)
+                    recorder.add_table_loads(stats)
+                self.add_constraints(engine, metadata)
+                with recorder.stage('aggregates'), engine.begin() as connection:
+                    save_watermark(connection, metadata, watermark, len(fact_subscription))
+                    save_fill_statistics(connection, metadata, statistics)
+                    refresh_aggregates(connection, metadata)
+            with recorder.stage('analyze'):
+                analyze_tables(engine, metadata)
+            print(f"Processed {self.csv_file} and loaded into PostgreSQL.")
+        except Exception as e:
+            raise RuntimeError(f"Data loading failed: {e}")
+        self.export(engine, metadata, frames)
+
+    # Multi-file variant of process_csv: the extracts of a directory or glob are parsed and cleaned
+    # in worker processes, merged into one surrogate key space and loaded in a single pass
+    def process_csv_files(self, engine, metadata):
+        args, recorder = self.args, self.recorder
+        paths = expand_inputs(self.csv_file)
+        try:
+            with recorder.stage('parallel_transform') as stage:
+                results, failures = transform_files(paths, args.workers)
+                frames = merge_partials(results, args.calendar_start, args.calendar_end)
+                stage['rows'] = len(frames['fact_subscription'])
+                stage['files'] = len(results)
+        except Exception as e:
+            raise RuntimeError(f"Data transformation failed: {e}")
+
+        try:
+            with recorder.stage('load', rows=sum(len(frame) for frame in frames.values())):
+                if args.concurrent_load:
+                    stats = load_batches(self.concurrent_loader(engine, metadata), split_batches(metadata, frames, args.chunk_size))
+                else:
+                    stats = load_tables(engine, metadata, frames, loader=args.loader, batch_size=args.batch_size, copy_format=args.copy_format)
+                recorder.add_table_loads(stats)
+            self.add_constraints(engine, metadata)
+            with recorder.stage('aggregates'), engine.begin() as connection:
+                for watermark in file_watermarks(results, watermark_identity):
+                    save_watermark(connection, metadata, watermark, watermark['LastRow'])
+                save_fill_statistics(connection, metadata, merge_fill_statistics(result['statistics'] for result in results))
+                refresh_aggregates(connection, metadata)
+            with recorder.stage('analyze'):
+                analyze_tables(engine, metadata)
+            print(f"Processed {len(results)} of {len(paths)} files matching {self.csv_file} and loaded into PostgreSQL.")
+        except Exception as e:
+            raise RuntimeError(f"Data loading failed: {e}")
+        if failures:
+            print(f"Warning: {len(failures)} file(s) were skipped: {', '.join(sorted(failures))}")
+        self.export(engine, metadata, frames)
+
+    # Streaming variant of process_csv: the CSV is read, cleaned and loaded chunk by chunk
+    def process_csv_streaming(self, engine, metadata):
+        args, recorder = self.args, self.recorder
+        try:
+            with recorder.stage('scan') as stage:
+                scan = scan_subscriptions(self.csv_file, args.chunk_size)
+                stage['rows'] = scan['rows']
+        except Exception as e:
+            raise ValueError(f"Data cleaning failed: {e}")
+
+        try:
+            with recorder.stage('stream_load', rows=scan['rows']):
+                recorder.add_table_loads(self.stream_load(engine, metadata, scan), stage='stream_load')
+            self.add_constraints(engine, metadata)
+            with recorder.stage('aggregates'), engine.begin() as connection:
+                save_watermark(connection, metadata, stream_watermark(watermark_identity(self.csv_file, scan['rows']), scan), scan['rows'])
+                save_fill_statistics(connection, metadata, scan['fill_statistics'])
+                refresh_aggregates(connection, metadata)
+            with recorder.stage('analyze'):
+                analyze_tables(engine, metadata)
+            print(f"Processed {self.csv_file} in chunks of {args.chunk_size} rows and loaded into PostgreSQL.")
+        except Exception as e:
+            raise RuntimeError(f"Data loading failed: {e}")
+        self.export(engine, metadata, None)
+
+    # Star schema frames of every chunk of the scanned CSV
+    def star_schema_chunks(self, scan):
+        return stream_star_schema(self.csv_file, scan, self.args.chunk_size, self.args.calendar_start, self.args.calendar_end)
+
+    # Load the chunks of the streaming pipeline; returns the table load stats
+    def stream_load(self, engine, metadata, scan):
+        return self.stream_batches(engine, metadata, (frames for frames, _ in self.star_schema_chunks(scan)))
+
+    # Step after a successful load, given the loaded frames (None when they were streamed); the
+    # ETL stops at the database
+    def export(self, engine, metadata, frames):
+        pass
+
+# Run the pipeline on source (a CSV file, directory or glob; relative paths are taken from the
+# script directory like --csv-path) against the database of config. options are the command-line
+# options by name (mode='incremental', streaming=True, ...) with the same defaults, and engine
+# reuses the connection pool of a caller that runs several files. Returns the stage records.
+def run_pipeline(config, source=None, engine=None, **options):
+    run_args = run_options(parser, source, **options)
+    error = option_error(run_args)
+    if error:
+        raise ValueError(error)
+    return EtlPipeline(run_args, config).run(engine)
 
-    # Load data using pandas.to_sql with SQLAlchemy engine
-    try:
-        dim_student.to_sql('dim_student', engine, schema=SCHEMA, if_exists='append', index=False)
-        dim_instructor.to_sql('dim_instructor', engine, schema=SCHEMA, if_exists='append', index=False)
-        dim_course_offering.to_sql('dim_course_offering', engine, schema=SCHEMA, if_exists='append', index=False)
-        dim_time.to_sql('dim_time', engine, schema=SCHEMA, if_exists='append', index=False)
-        fact_subscription.to_sql('fact_subscription', engine, schema=SCHEMA, if_exists='append', index=False)
-        print(f"Processed {CSV_FILE} and loaded into PostgreSQL.")
-    except Exception as e:
-        raise RuntimeError(f"Data loading failed: {e}")
-    
 
 if __name__ == "__main__":
+    # Load environment variables from .env file
+    load_dotenv()
+    options = parser.parse_args()
+    error = option_error(options)
+    if error:
+        parser.error(error)
     try:
-        process_csv()
+        run_pipeline(validate_config(), **vars(options))
     except Exception as e:
         print(f"ETL process failed: {e}", file=sys.stderr)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
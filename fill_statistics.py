@@ -0,0 +1,192 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from cleaning import MEDIAN_COLUMNS, MODE_COLUMNS, median_from_counts, mode_from_counts
+from star_schema import FILL_STATISTICS_TABLE, schema_table
+
+# Distinct values a quantile sketch keeps exactly; 65536 days cover 179 years, so date medians
+# stay exact and only timestamps or continuous values ever get compressed
+DEFAULT_QUANTILE_BINS = 1 << 16
+
+# Candidates a heavy-hitter summary tracks for a mode
+DEFAULT_HEAVY_HITTERS = 1024
+
+# Value counts of one column without the missing values and, for categoricals, without the
+# categories that do not occur
+def observed_counts(values):
+    counts = values.value_counts()
+    counts = counts[counts > 0]
+    if isinstance(counts.index, pd.CategoricalIndex):
+        counts.index = pd.Index(np.asarray(counts.index))
+    return counts
+
+# Index of a sketch as JSON values and back; timestamps travel as ISO strings
+def encode_index(index):
+    if pd.api.types.is_datetime64_any_dtype(index.dtype):
+        return [value.isoformat() for value in index]
+    return index.tolist()
+
+def decode_index(values, dtype):
+    return pd.Index(values).astype(dtype) if values else pd.Index([], dtype=dtype)
+
+# Mergeable histogram for medians: (value, count) bins, exact while the column has at most
+# max_bins distinct values. Past that, neighbouring values are merged into max_bins centroids of
+# about equal weight (their weighted mean), so the median can be off by the width of one bin.
+class QuantileSketch:
+    kind = 'quantile'
+
+    def __init__(self, counts=None, max_bins=DEFAULT_QUANTILE_BINS, compressed=False):
+        self.counts = counts if counts is not None else pd.Series(dtype='int64')
+        self.max_bins = max_bins
+        self.compressed = compressed
+        if len(self.counts) > max_bins:
+            self.compress()
+
+    @classmethod
+    def from_values(cls, values, max_bins=DEFAULT_QUANTILE_BINS):
+        return cls(observed_counts(values), max_bins)
+
+    def compress(self):
+        counts = self.counts.sort_index()
+        datetimes = pd.api.types.is_datetime64_any_dtype(counts.index.dtype)
+        values = counts.index.to_numpy(dtype='datetime64[us]').astype('int64') if datetimes else counts.index.to_numpy(dtype='float64')
+        weights = counts.to_numpy(dtype='float64')
+        # Bin of every value by its position in the cumulative weight
+        bins = np.minimum((np.cumsum(weights) - weights) * self.max_bins // weights.sum(), self.max_bins - 1).astype('int64')
+        bin_weights = np.bincount(bins, weights=weights)
+        centroids = np.bincount(bins, weights=values * weights) / np.where(bin_weights > 0, bin_weights, 1)
+        keep = bin_weights > 0
+        centroids = centroids[keep]
+        index = pd.Index(centroids.round().astype('int64').astype('datetime64[us]')) if datetimes else pd.Index(centroids)
+        self.counts = pd.Series(bin_weights[keep].round().astype('int64'), index=index).groupby(level=0).sum()
+        self.compressed = True
+
+    def merge(self, other):
+        return QuantileSketch(self.counts.add(other.counts, fill_value=0).astype('int64'), self.max_bins,
+                              self.compressed or other.compressed)
+
+    def count(self):
+        return int(self.counts.sum())
+
+    # Median like Series.median() over every value seen (approximate once compressed)
+    def estimate(self):
+        return median_from_counts(self.counts)
+
+    def to_state(self):
+        return {'kind': self.kind, 'capacity': self.max_bins, 'compressed': self.compressed,
+                'dtype': str(self.counts.index.dtype), 'values': encode_index(self.counts.index),
+                'counts': self.counts.astype('int64').tolist()}
+
+# Mergeable heavy-hitter summary for modes (Misra-Gries): counts of at most `capacity` values.
+# Exact while the column has no more distinct values than that; past it every kept count is
+# lowered by the first count that does not fit, which keeps every value more frequent than
+# 1/(capacity + 1) of the rows and therefore the mode of any skewed column.
+class HeavyHitters:
+    kind = 'heavy_hitters'
+
+    def __init__(self, counts=None, capacity=DEFAULT_HEAVY_HITTERS, compressed=False):
+        self.counts = counts if counts is not None else pd.Series(dtype='int64')
+        self.capacity = capacity
+        self.compressed = compressed
+        if len(self.counts) > capacity:
+            self.compress()
+
+    @classmethod
+    def from_values(cls, values, capacity=DEFAULT_HEAVY_HITTERS):
+        return cls(observed_counts(values), capacity)
+
+    def compress(self):
+        counts = self.counts.sort_values(ascending=False, kind='stable')
+        counts = counts - counts.iloc[self.capacity]
+        self.counts = counts[counts > 0]
+        self.compressed = True
+
+    def merge(self, other):
+        return HeavyHitters(self.counts.add(other.counts, fill_value=0).astype('int64'), self.capacity,
+                            self.compressed or other.compressed)
+
+    def count(self):
+        return int(self.counts.sum())
+
+    # Most frequent value, ties to the smallest like Series.mode()[0]
+    def estimate(self):
+        return mode_from_counts(self.counts)
+
+    def to_state(self):
+        return {'kind': self.kind, 'capacity': self.capacity, 'compressed': self.compressed,
+                'dtype': str(self.counts.index.dtype), 'values': encode_index(self.counts.index),
+                'counts': self.counts.astype('int64').tolist()}
+
+SKETCH_TYPES = {sketch.kind: sketch for sketch in (QuantileSketch, HeavyHitters)}
+
+def sketch_from_state(state):
+    counts = pd.Series(state['counts'], index=decode_index(state['values'], state['dtype']), dtype='int64')
+    return SKETCH_TYPES[state['kind']](counts, state['capacity'], state['compressed'])
+
+# Statistics behind the fill values: a quantile sketch per median column and a heavy-hitter
+# summary per mode column. Sketches of chunks, files or earlier runs merge into the sketch of
+# all their rows, so fill values never need the rows themselves again.
+class FillStatistics:
+    def __init__(self, sketches=None):
+        self.sketches = sketches or {}
+
+    @classmethod
+    def from_frame(cls, df):
+        sketches = {col: QuantileSketch.from_values(df[col]) for col in MEDIAN_COLUMNS if col in df.columns}
+        sketches.update({col: HeavyHitters.from_values(df[col]) for col in MODE_COLUMNS if col in df.columns})
+        return cls(sketches)
+
+    def merge(self, other):
+        if other is None:
+            return self
+        sketches = dict(self.sketches)
+        for col, sketch in other.sketches.items():
+            sketches[col] = sketches[col].merge(sketch) if col in sketches else sketch
+        return FillStatistics(sketches)
+
+    # Median or mode of every fill column; None for columns without any value
+    def fill_values(self):
+        values = {col: None for col in MEDIAN_COLUMNS + MODE_COLUMNS}
+        values.update({col: sketch.estimate() for col, sketch in self.sketches.items()})
+        return values
+
+    # Columns whose fill value is an estimate because their sketch had to be compressed
+    def approximate_columns(self):
+        return [col for col, sketch in self.sketches.items() if sketch.compressed]
+
+    def to_state(self):
+        return {col: sketch.to_state() for col, sketch in self.sketches.items()}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls({col: sketch_from_state(sketch) for col, sketch in (state or {}).items()})
+
+# Merge the statistics of several chunks or files
+def merge_fill_statistics(statistics):
+    total = FillStatistics()
+    for part in statistics:
+        total = total.merge(part)
+    return total
+
+# Statistics of everything loaded into the schema so far (empty before the first load)
+def read_fill_statistics(engine, metadata):
+    table = schema_table(metadata, FILL_STATISTICS_TABLE)
+    with engine.connect() as connection:
+        rows = connection.execute(select(table.c.Column, table.c.State)).all()
+    return FillStatistics.from_state({column: json.loads(state) for column, state in rows})
+
+# Replace the stored statistics inside the caller's transaction
+def save_fill_statistics(connection, metadata, statistics):
+    table = schema_table(metadata, FILL_STATISTICS_TABLE)
+    connection.execute(table.delete())
+    rows = [{'Column': col, 'State': json.dumps(state), 'UpdatedAt': datetime.now()}
+            for col, state in statistics.to_state().items()]
+    if rows:
+        connection.execute(table.insert(), rows)
+    approximate = statistics.approximate_columns()
+    if approximate:
+        print(f"Fill values of {', '.join(approximate)} are estimated from compressed sketches")
@@ -0,0 +1,98 @@
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from db_config import validate_config, get_engine
+from star_schema import build_metadata, schema_table
+
+FLATTENED_VIEW = 'v_flattened_subscription'
+
+# Columns of the flattened extract and the SQL computing them over fact_subscription (f),
+# dim_student (s) and dim_course_offering (o). Dates and their parts are decoded from the
+# YYYYMMDD time keys, so dim_time is not joined.
+FLATTENED_VIEW_COLUMNS = {
+    'Student': 's."Student"',
+    'StudentGender': 's."StudentGender"',
+    'StudentBirthDate': 's."StudentBirthDate"',
+    'professionalExperience': 's."professionalExperience"',
+    'Industry': 's."Industry"',
+    'GroupName': 'o."GroupName"',
+    'SessionName': 'o."SessionName"',
+    'TrackName': 'o."TrackName"',
+    'Hackerspace': 'o."Hackerspace"',
+    'Country': 'o."Country"',
+    'ProductSchedule': 'o."ProductSchedule"',
+    'InstructorID': 'o."InstructorID"',
+}
+for key, date_column, prefix in [('StartTimeID', 'SubscriptionStartDate', 'Start'),
+                                 ('EndTimeID', 'SubscriptionEndDate', 'End'),
+                                 ('DiplomaTimeID', 'DiplomaDate', 'Diploma')]:
+    FLATTENED_VIEW_COLUMNS[date_column] = f"TO_DATE(CAST(f.\"{key}\" AS TEXT), 'YYYYMMDD')"
+    FLATTENED_VIEW_COLUMNS[f'{prefix}Year'] = f'f."{key}" / 10000'
+    FLATTENED_VIEW_COLUMNS[f'{prefix}Month'] = f'f."{key}" / 100 % 100'
+    FLATTENED_VIEW_COLUMNS[f'{prefix}Day'] = f'f."{key}" % 100'
+FLATTENED_VIEW_COLUMNS['SubscriptionProgress'] = 'f."SubscriptionProgress"'
+FLATTENED_VIEW_COLUMNS['SubscriptionHasDiploma'] = 'f."SubscriptionHasDiploma"'
+
+# Qualified, quoted name of the flattened view (bind is an engine or a connection)
+def view_name(bind, metadata):
+    preparer = bind.dialect.identifier_preparer
+    name = preparer.quote(FLATTENED_VIEW)
+    return f'{preparer.quote_schema(metadata.schema)}.{name}' if metadata.schema else name
+
+# (Re)create the flattened view over the star schema
+def create_flattened_view(connection, metadata):
+    preparer = connection.dialect.identifier_preparer
+    fact = preparer.format_table(schema_table(metadata, 'fact_subscription'))
+    student = preparer.format_table(schema_table(metadata, 'dim_student'))
+    offering = preparer.format_table(schema_table(metadata, 'dim_course_offering'))
+    select_list = ', '.join(f"{sql} AS {preparer.quote(column)}" for column, sql in FLATTENED_VIEW_COLUMNS.items())
+    connection.execute(text(
+        f"CREATE OR REPLACE VIEW {view_name(connection, metadata)} AS SELECT {select_list} "
+        f"FROM {fact} AS f "
+        f'LEFT JOIN {offering} AS o ON o."CourseOfferingID" = f."CourseOfferingID" '
+        f'LEFT JOIN {student} AS s ON s."StudentID" = f."StudentID"'))
+
+# Stream the flattened view through COPY ... TO STDOUT into a file, or to stdout for '-'.
+# Rows go straight from the server to the output, memory stays flat whatever the fact size.
+def copy_flattened_view(engine, metadata, output_path):
+    started = time.perf_counter()
+    statement = f"COPY (SELECT * FROM {view_name(engine, metadata)}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if output_path == '-':
+            cursor.copy_expert(statement, sys.stdout)
+            sys.stdout.flush()
+        else:
+            with open(output_path, 'w', newline='', encoding='utf-8') as handle:
+                cursor.copy_expert(statement, handle)
+        rows = cursor.rowcount
+        cursor.close()
+    finally:
+        connection.close()
+    if output_path != '-':
+        print(f"Copied {rows} rows of {FLATTENED_VIEW} to {output_path} in {time.perf_counter() - started:.2f}s")
+    return rows
+
+# Regenerate the flattened extract from an already loaded star schema, without the ETL
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the flattened subscription extract from the star schema")
+    parser.add_argument('--output', type=str, default='flattened_subscription_data.csv', help="Output CSV file, or - for stdout")
+    args = parser.parse_args()
+    try:
+        load_dotenv()
+        config = validate_config()
+        engine = get_engine(config)
+        metadata = build_metadata(config['SCHEMA'])
+        with engine.begin() as connection:
+            create_flattened_view(connection, metadata)
+        output_path = args.output if args.output == '-' else os.path.abspath(args.output)
+        copy_flattened_view(engine, metadata, output_path)
+    except Exception as e:
+        print(f"Flattened export failed: {e}", file=sys.stderr)
+        sys.exit(1)
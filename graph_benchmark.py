@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from db_config import validate_config, get_engine
+from bulk_loader import load_tables, create_tables_without_foreign_keys, add_foreign_keys, create_indexes
+from table_layout import analyze_tables
+from attendance_graph import AttendanceGraph, build_graph_metadata
+
+SQL_FILE = 'Cypher-to-SQL.sql'
+
+DEFAULT_STUDENTS = 100_000
+DEFAULT_SESSIONS = 20_000
+DEFAULT_ATTENDANCE = 2_000_000
+DEFAULT_MODULES = 40
+DEFAULT_ABSENT_RATE = 0.05
+
+# Q1 of Cypher-to-SQL.sql looks up this student; the generator always creates one
+Q1_NAME = 'Alice'
+
+FIRST_NAMES = ['Alice', 'Amine', 'Aziz', 'Chaima', 'Dhia', 'Emna', 'Fares', 'Ghada', 'Hedi', 'Ines', 'Karim',
+               'Lina', 'Mehdi', 'Nour', 'Omar', 'Rania', 'Sami', 'Syrine', 'Walid', 'Yasmine']
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# The graph query answering each SQL query of Cypher-to-SQL.sql
+GRAPH_QUERIES = {
+    'Q1': lambda graph: graph.student_sessions(Q1_NAME),
+    'Q2': lambda graph: graph.top_attendees(3),
+    'Q3': lambda graph: graph.session_attendance(),
+    'Q4': lambda graph: graph.module_unique_students(),
+    'Q5': lambda graph: graph.absent_students(),
+}
+
+# The queries of the translation file by label (Q1, Q2, ...): a label line, then its SQL
+def read_sql_queries(path):
+    queries, label = {}, None
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            if re.fullmatch(r'Q\d+', line.strip()):
+                label = line.strip()
+                queries[label] = ''
+            elif label and line.strip():
+                queries[label] += line
+    return {label: sql.strip().rstrip(';') for label, sql in queries.items()}
+
+# Students, sessions and attendance shaped like a bootcamp: names repeat, a few students attend
+# far more sessions than the rest (Pareto activity), modules differ in size and absent_rate of
+# the students never attend
+def generate_attendance(students, sessions, attendance, modules, seed=0, absent_rate=DEFAULT_ABSENT_RATE):
+    rng = np.random.default_rng(seed)
+    names = pd.Series(rng.choice(FIRST_NAMES, students)) + ' ' + pd.Series(rng.integers(1, max(students // 20, 2), students)).astype(str)
+    names[0] = Q1_NAME
+    student_frame = pd.DataFrame({'student_id': np.arange(1, students + 1), 'name': names})
+
+    module_weights = rng.pareto(1.0, modules) + 1
+    session_modules = rng.choice(modules, sessions, p=module_weights / module_weights.sum())
+    session_frame = pd.DataFrame({
+        'session_id': np.arange(1, sessions + 1),
+        'date': pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 730, sessions), unit='D'),
+        'module': [f'Module {module + 1}' for module in session_modules],
+    })
+
+    active = rng.random(students) >= absent_rate
+    active[0] = True
+    active_rows = np.flatnonzero(active)
+    activity = rng.pareto(1.5, len(active_rows)) + 1
+    attendance_frame = pd.DataFrame({
+        'student_id': student_frame['student_id'].to_numpy()[rng.choice(active_rows, attendance, p=activity / activity.sum())],
+        'session_id': rng.integers(1, sessions + 1, attendance),
+    })
+    return {'students': student_frame, 'sessions': session_frame, 'attendance': attendance_frame}
+
+# Rebuild the graph tables in schema and bulk load the generated frames, indexes last
+def load_graph_tables(engine, schema, frames):
+    metadata = build_graph_metadata(schema)
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {engine.dialect.identifier_preparer.quote_schema(schema)} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {engine.dialect.identifier_preparer.quote_schema(schema)}"))
+    started = time.perf_counter()
+    create_tables_without_foreign_keys(engine, metadata)
+    load_tables(engine, metadata, frames, copy_format='binary')
+    add_foreign_keys(engine, metadata)
+    create_indexes(engine, metadata)
+    analyze_tables(engine, metadata)
+    return time.perf_counter() - started
+
+# Best wall time of repeat calls of run, with the result of the last call
+def best_time(run, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+# Run one SQL query against the graph tables and fetch its rows into a DataFrame
+def run_sql(engine, schema, sql):
+    with engine.connect() as connection:
+        connection.execute(text(f"SET search_path TO {engine.dialect.identifier_preparer.quote_schema(schema)}"))
+        return pd.read_sql_query(text(sql), connection)
+
+# Rows of a result in a canonical order, so results of SQL and of the graph compare regardless
+# of row order and of how dates are typed
+def canonical(frame):
+    frame = frame.copy()
+    if 'date' in frame.columns:
+        frame['date'] = pd.to_datetime(frame['date'])
+    frame = frame.astype(str)
+    return frame.sort_values(list(frame.columns)).reset_index(drop=True)
+
+# Whether the graph answered a query like the SQL. Q2 keeps the three highest counts, and which
+# names tie for the last place is up to the database, so only its counts are compared.
+def same_result(label, sql_result, graph_result):
+    if label == 'Q2':
+        return sorted(sql_result['session_count'].tolist()) == sorted(graph_result['session_count'].tolist())
+    return canonical(sql_result).equals(canonical(graph_result[sql_result.columns]))
+
+# One line per query: SQL and graph time, speedup, rows and whether the results agree
+def report(records):
+    print(f"{'query':<6} {'sql s':>9} {'graph s':>9} {'speedup':>9} {'rows':>10} {'match':>6}")
+    for record in records:
+        speedup = record['sql_seconds'] / record['graph_seconds'] if record['graph_seconds'] > 0 else float('inf')
+        print(f"{record['query']:<6} {record['sql_seconds']:>9.4f} {record['graph_seconds']:>9.4f} "
+              f"{speedup:>8.1f}x {record['rows']:>10} {'yes' if record['match'] else 'NO':>6}")
+
+# Generate the graph, load it for SQL, build the in-memory graph from the loaded tables and
+# time Q1-Q5 both ways
+def run_graph_benchmark(engine, schema, students, sessions, attendance, modules, seed=0, repeat=3,
+                        absent_rate=DEFAULT_ABSENT_RATE, sql_path=os.path.join(script_dir, SQL_FILE)):
+    queries = read_sql_queries(sql_path)
+    missing = [label for label in GRAPH_QUERIES if label not in queries]
+    if missing:
+        raise ValueError(f"{sql_path} has no {', '.join(missing)}")
+
+    started = time.perf_counter()
+    frames = generate_attendance(students, sessions, attendance, modules, seed=seed, absent_rate=absent_rate)
+    print(f"Generated {students} students, {sessions} sessions and {attendance} attendances in {time.perf_counter() - started:.2f}s")
+    load_seconds = load_graph_tables(engine, schema, frames)
+    build_seconds, graph = best_time(lambda: AttendanceGraph.from_database(engine, schema), 1)
+
+    records = []
+    for label, query in GRAPH_QUERIES.items():
+        sql_seconds, sql_result = best_time(lambda: run_sql(engine, schema, queries[label]), repeat)
+        graph_seconds, graph_result = best_time(lambda: query(graph), repeat)
+        records.append({'query': label, 'sql_seconds': sql_seconds, 'graph_seconds': graph_seconds,
+                        'rows': len(sql_result), 'match': same_result(label, sql_result, graph_result)})
+    report(records)
+    print(f"SQL tables loaded and indexed in {load_seconds:.2f}s; graph built from them in {build_seconds:.2f}s "
+          f"({graph.nbytes() / 1e6:.1f} MB)")
+
+    started = datetime.now().isoformat(timespec='seconds')
+    for record in records:
+        record.update({'benchmark_started': started, 'students': students, 'sessions': sessions,
+                       'attendance': attendance, 'modules': modules, 'seed': seed,
+                       'load_seconds': load_seconds, 'build_seconds': build_seconds, 'graph_bytes': graph.nbytes()})
+    return records
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the in-memory attendance graph against the SQL of Cypher-to-SQL.sql on generated data")
+    parser.add_argument('--students', type=int, default=DEFAULT_STUDENTS, help="Students to generate")
+    parser.add_argument('--sessions', type=int, default=DEFAULT_SESSIONS, help="Sessions to generate")
+    parser.add_argument('--attendance', type=int, default=DEFAULT_ATTENDANCE, help="Attendance rows (graph edges) to generate")
+    parser.add_argument('--modules', type=int, default=DEFAULT_MODULES, help="Modules the sessions belong to")
+    parser.add_argument('--absent-rate', type=float, default=DEFAULT_ABSENT_RATE, help="Share of students without any attendance")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per query; the best time is reported")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the generated graph")
+    parser.add_argument('--schema', type=str, default='graph_benchmark', help="Database schema the graph tables are rebuilt in")
+    parser.add_argument('--results', type=str, help="JSON lines file the per-query records are appended to")
+    args = parser.parse_args()
+    try:
+        load_dotenv()
+        engine = get_engine(validate_config())
+        records = run_graph_benchmark(engine, args.schema, args.students, args.sessions, args.attendance, args.modules,
+                                      seed=args.seed, repeat=args.repeat, absent_rate=args.absent_rate)
+        if args.results:
+            with open(args.results, 'a', encoding='utf-8') as handle:
+                for record in records:
+                    handle.write(json.dumps(record) + '\n')
+            print(f"Benchmark results appended to {args.results}")
+    except Exception as e:
+        print(f"Graph benchmark failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not all(record['match'] for record in records):
+        print("The graph and the SQL disagree on some queries", file=sys.stderr)
+        sys.exit(2)
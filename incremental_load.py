@@ -0,0 +1,221 @@
+import hashlib
+import itertools
+import os
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, Integer, select, func, text, or_, false
+
+from bulk_loader import DEFAULT_BATCH_SIZE, copy_frame
+from star_schema import NATURAL_KEYS, SMART_KEY_TABLES, WATERMARK_TABLE, schema_table
+from table_layout import ensure_partitions
+from kpi_aggregates import refresh_aggregates
+from date_parsing import DateParser
+from fill_statistics import save_fill_statistics
+
+MODES = ('full', 'incremental')
+
+# Key under which a source file's watermark is stored
+def source_key(csv_path):
+    return os.path.basename(csv_path)
+
+# Rows of an extract its fingerprint covers at most
+FINGERPRINT_ROWS = 100
+
+# Content identity of an extract: a hash of its header and first rows (at most FINGERPRINT_ROWS,
+# line endings ignored). An export that only grew keeps the fingerprint of the rows it had; a
+# different export under a reused name gets another one.
+def file_fingerprint(csv_path, rows):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(csv_path, 'rb') as handle:
+        for line in itertools.islice(handle, min(rows, FINGERPRINT_ROWS) + 1):
+            digest.update(line.rstrip(b'\r\n') + b'\n')
+    return digest.hexdigest()
+
+# Source and fingerprint of an extract whose first `rows` rows are being loaded
+def watermark_identity(csv_path, rows):
+    return {'Source': source_key(csv_path), 'Fingerprint': file_fingerprint(csv_path, rows)}
+
+# Stored watermark of the extract at csv_path, or None on its first run. Watermarks are kept per
+# file name and fingerprint, so only the one whose header and first rows this file still starts
+# with applies; another extract under the same name is scanned from its first row.
+def read_watermark(engine, metadata, csv_path):
+    table = schema_table(metadata, WATERMARK_TABLE)
+    with engine.connect() as connection:
+        rows = connection.execute(select(table).where(table.c.Source == source_key(csv_path))
+                                  .order_by(table.c.LastRow.desc())).mappings().all()
+    for row in rows:
+        if row['Fingerprint'] == file_fingerprint(csv_path, row['LastRow'] or 0):
+            return dict(row)
+    return None
+
+# Start dates of the raw (typed, not yet cleaned) extract
+def raw_start_dates(df):
+    return DateParser().parse(df['SubscriptionStartDate'], 'SubscriptionStartDate')
+
+# Rows of the raw extract that have not been loaded yet
+def select_new_rows(df, watermark):
+    if watermark is None:
+        return df
+    last_row = watermark['LastRow'] or 0
+    if len(df) >= last_row:
+        # Append-only export: everything past the last processed row is new
+        return df.iloc[last_row:].copy()
+    if watermark['LastStartDate'] is None:
+        return df
+    # The file was replaced by a shorter extract, fall back to the start date high-water mark
+    return df[raw_start_dates(df) > watermark['LastStartDate']].copy()
+
+# Watermark to store once the raw extract has been loaded (computed before cleaning fills dates).
+# It replaces the previous one, whose fingerprint covered fewer rows when the file was smaller.
+def next_watermark(identity, df, previous=None):
+    last_start = raw_start_dates(df).max()
+    last_start = None if pd.isna(last_start) else last_start.to_pydatetime()
+    if previous and previous['LastStartDate'] is not None:
+        if last_start is None or previous['LastStartDate'] > last_start:
+            last_start = previous['LastStartDate']
+    return {**identity, 'LastStartDate': last_start, 'LastRow': len(df),
+            'Replaces': previous['Fingerprint'] if previous else None}
+
+# Replace the watermark row of an extract (and the one it supersedes) inside the caller's transaction
+def save_watermark(connection, metadata, watermark, rows_loaded):
+    table = schema_table(metadata, WATERMARK_TABLE)
+    watermark = dict(watermark)
+    fingerprints = {watermark['Fingerprint'], watermark.pop('Replaces', None)} - {None}
+    connection.execute(table.delete().where(table.c.Source == watermark['Source'], table.c.Fingerprint.in_(fingerprints)))
+    connection.execute(table.insert().values(**watermark, RowsLoaded=rows_loaded, LoadedAt=datetime.now()))
+
+# Translate run-local foreign keys into the stable surrogate keys of their dimensions
+def remap_foreign_keys(table, frame, key_maps):
+    frame = frame.copy()
+    for foreign_key in table.foreign_keys:
+        column = foreign_key.parent.name
+        target = foreign_key.column.table.name
+        if column in frame.columns and target in key_maps:
+            frame[column] = frame[column].map(key_maps[target])
+    return frame
+
+# Block other writers on a table while leaving it readable for dashboards
+def lock_for_write(connection, table):
+    target = connection.dialect.identifier_preparer.format_table(table)
+    connection.execute(text(f"LOCK TABLE {target} IN SHARE ROW EXCLUSIVE MODE"))
+
+# Upsert dimension members by natural key; returns run-local ID -> stable surrogate ID
+def upsert_dimension(connection, table, frame, natural_key, batch_size=DEFAULT_BATCH_SIZE, copy_format='csv'):
+    surrogate = table.primary_key.columns.values()[0].name
+    attributes = [column.name for column in table.columns if column.name != surrogate and column.name not in natural_key]
+    if frame[natural_key].isna().any().any():
+        raise ValueError(f"Null natural key values in {table.name}: {', '.join(natural_key)}")
+
+    # One staging row per natural key, the last occurrence carries the newest attributes
+    codes = frame.groupby(natural_key, sort=False).ngroup().to_numpy()
+    staged = frame.assign(stage_row=codes).drop_duplicates('stage_row', keep='last')
+    stage = Table(f'stage_{table.name}', MetaData(),
+                  Column('stage_row', Integer),
+                  *[Column(name, table.c[name].type) for name in natural_key + attributes],
+                  prefixes=['TEMPORARY'], postgresql_on_commit='DROP')
+    stage.create(connection)
+    copy_frame(connection.connection.cursor(), connection.engine, stage, staged,
+               batch_size=batch_size, copy_format=copy_format)
+
+    preparer = connection.dialect.identifier_preparer
+    quote = preparer.quote
+    target = preparer.format_table(table)
+    key_match = ' AND '.join(f"d.{quote(name)} = s.{quote(name)}" for name in natural_key)
+    lock_for_write(connection, table)
+
+    updated = 0
+    if attributes:
+        assignments = ', '.join(f"{quote(name)} = s.{quote(name)}" for name in attributes)
+        changed = ' OR '.join(f"d.{quote(name)} IS DISTINCT FROM s.{quote(name)}" for name in attributes)
+        updated = connection.execute(text(
+            f"UPDATE {target} AS d SET {assignments} FROM {quote(stage.name)} AS s "
+            f"WHERE {key_match} AND ({changed})")).rowcount
+
+    columns = natural_key + attributes
+    inserted = connection.execute(text(
+        f"INSERT INTO {target} ({quote(surrogate)}, {', '.join(quote(name) for name in columns)}) "
+        f"SELECT base.max_id + ROW_NUMBER() OVER (ORDER BY s.stage_row), {', '.join('s.' + quote(name) for name in columns)} "
+        f"FROM {quote(stage.name)} AS s "
+        f"CROSS JOIN (SELECT COALESCE(MAX({quote(surrogate)}), 0) AS max_id FROM {target}) AS base "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {target} AS d WHERE {key_match})")).rowcount
+
+    # MIN() keeps lookups deterministic if an older full load left duplicate members
+    resolved = connection.execute(text(
+        f"SELECT s.stage_row, MIN(d.{quote(surrogate)}) FROM {quote(stage.name)} AS s "
+        f"JOIN {target} AS d ON {key_match} GROUP BY s.stage_row")).all()
+    stable_ids = dict(resolved)
+    print(f"Upserted {table.name}: {inserted} new, {updated} changed members")
+    return dict(zip(frame[surrogate], (stable_ids[code] for code in codes)))
+
+# Insert the rows of a smart-keyed table that are not there yet; existing rows are left untouched
+def insert_missing_rows(connection, table, frame, batch_size=DEFAULT_BATCH_SIZE, copy_format='csv'):
+    stage = Table(f'stage_{table.name}', MetaData(),
+                  *[Column(column.name, column.type) for column in table.columns],
+                  prefixes=['TEMPORARY'], postgresql_on_commit='DROP')
+    stage.create(connection)
+    copy_frame(connection.connection.cursor(), connection.engine, stage, frame,
+               batch_size=batch_size, copy_format=copy_format)
+
+    preparer = connection.dialect.identifier_preparer
+    quote = preparer.quote
+    target = preparer.format_table(table)
+    key = table.primary_key.columns.values()[0].name
+    columns = ', '.join(quote(column.name) for column in table.columns)
+    lock_for_write(connection, table)
+    inserted = connection.execute(text(
+        f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {quote(stage.name)} AS s "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {target} AS d WHERE d.{quote(key)} = s.{quote(key)})")).rowcount
+    print(f"Inserted {inserted} missing rows into {table.name}")
+
+# Append fact rows after the current highest surrogate key
+def append_facts(connection, table, frame, batch_size=DEFAULT_BATCH_SIZE, copy_format='csv'):
+    surrogate = table.primary_key.columns.values()[0].name
+    ensure_partitions(connection, table, frame)
+    lock_for_write(connection, table)
+    base = connection.execute(select(func.coalesce(func.max(table.c[surrogate]), 0))).scalar()
+    frame = frame.assign(**{surrogate: range(base + 1, base + 1 + len(frame))})
+    copy_frame(connection.connection.cursor(), connection.engine, table, frame,
+               batch_size=batch_size, copy_format=copy_format)
+    print(f"Appended {len(frame)} rows to {table.name}")
+
+# Upsert dimensions, append facts, refresh the aggregates of the start months that got new
+# facts and advance the watermark (and the imputation sketches, when given) in one transaction,
+# so readers keep seeing the previous snapshot until the commit
+def load_incremental(engine, metadata, frames, watermark, batch_size=DEFAULT_BATCH_SIZE, copy_format='csv',
+                     fill_statistics=None):
+    key_maps = {}
+    fact_rows = 0
+    start_months = set()
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if table.name not in frames:
+                continue
+            frame = remap_foreign_keys(table, frames[table.name], key_maps)
+            if table.name in NATURAL_KEYS:
+                key_maps[table.name] = upsert_dimension(connection, table, frame, NATURAL_KEYS[table.name],
+                                                        batch_size=batch_size, copy_format=copy_format)
+            elif table.name in SMART_KEY_TABLES:
+                insert_missing_rows(connection, table, frame, batch_size=batch_size, copy_format=copy_format)
+            else:
+                append_facts(connection, table, frame, batch_size=batch_size, copy_format=copy_format)
+                fact_rows += len(frame)
+                if 'StartTimeID' in frame.columns:
+                    start_months.update((frame['StartTimeID'].dropna() // 100).tolist())
+        refresh_aggregates(connection, metadata, months=start_months)
+        save_watermark(connection, metadata, watermark, fact_rows)
+        if fill_statistics is not None:
+            save_fill_statistics(connection, metadata, fill_statistics)
+
+# Read the loaded star schema back, e.g. to rebuild extracts after an incremental run. With
+# start_months (YYYYMM), only the facts that started in those months are read.
+def read_star_tables(engine, metadata, names, start_months=None):
+    tables = {}
+    for name in names:
+        table = schema_table(metadata, name)
+        if start_months is not None and name == 'fact_subscription':
+            ranges = [table.c.StartTimeID.between(month * 100 + 1, month * 100 + 31) for month in sorted(start_months)]
+            tables[name] = pd.read_sql(select(table).where(or_(false(), *ranges)), engine)
+        else:
+            tables[name] = pd.read_sql_table(name, engine, schema=metadata.schema)
+    return tables
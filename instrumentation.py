@@ -0,0 +1,142 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is then not reported
+    resource = None
+
+METRICS_FORMATS = ('jsonl', 'prometheus')
+
+# Stage metrics exported to Prometheus, record field -> (metric name, help text)
+PROMETHEUS_METRICS = {
+    'wall_seconds': ('etl_stage_wall_seconds', 'Wall clock time of the stage'),
+    'cpu_seconds': ('etl_stage_cpu_seconds', 'CPU time of the process during the stage'),
+    'process_peak_rss_bytes': ('etl_process_peak_rss_bytes', 'High-water mark of the process resident set size (ru_maxrss) at the end of the stage, including every earlier stage'),
+    'peak_rss_growth_bytes': ('etl_stage_peak_rss_growth_bytes', 'How much the stage raised the process RSS high-water mark'),
+    'peak_traced_bytes': ('etl_stage_peak_traced_bytes', 'Peak Python allocations during the stage (tracemalloc)'),
+    'rows': ('etl_stage_rows', 'Rows processed by the stage'),
+    'rows_per_second': ('etl_stage_rows_per_second', 'Rows processed per second of wall time'),
+}
+
+# High-water mark of the resident set size of this process so far, in bytes (None where
+# unavailable). It never goes down, so a stage's own peak shows as the growth of this value.
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # kilobytes on Linux
+
+# Records wall time, CPU time, memory and row counts of named pipeline stages. With profile,
+# every stage also runs under cProfile and tracemalloc and leaves its reports in profile_dir.
+class StageRecorder:
+    def __init__(self, profile=False, profile_dir='profiles'):
+        self.records = []
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.run_started = datetime.now().isoformat(timespec='seconds')
+        if profile:
+            os.makedirs(profile_dir, exist_ok=True)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    # Measure the enclosed block; the yielded record takes extra fields such as record['rows']
+    @contextmanager
+    def stage(self, name, **fields):
+        record = {'stage': name, 'kind': 'stage', **fields}
+        profiler = cProfile.Profile() if self.profile else None
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        rss_started = peak_rss_bytes()
+        started, cpu_started = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record['wall_seconds'] = time.perf_counter() - started
+            record['cpu_seconds'] = time.process_time() - cpu_started
+            record['process_peak_rss_bytes'] = peak_rss_bytes()
+            if rss_started is not None:
+                record['peak_rss_growth_bytes'] = record['process_peak_rss_bytes'] - rss_started
+            if tracemalloc.is_tracing():
+                record['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+            if record.get('rows') is not None and record['wall_seconds'] > 0:
+                record['rows_per_second'] = record['rows'] / record['wall_seconds']
+            if profiler:
+                self.write_profile(name, profiler)
+            self.records.append(record)
+            self.report(record)
+
+    # Keep the throughput of table loads next to the stages (bulk_loader.report_load stats)
+    def add_table_loads(self, stats, stage='load'):
+        for load in stats or []:
+            self.records.append({'stage': f"{stage}:{load['table']}", 'kind': 'table_load', 'table': load['table'],
+                                 'loader': load['loader'], 'rows': load['rows'], 'wall_seconds': load['seconds'],
+                                 'rows_per_second': load['rows_per_second']})
+
+    # One line per finished stage
+    def report(self, record):
+        parts = [f"{record['wall_seconds']:.2f}s wall", f"{record['cpu_seconds']:.2f}s CPU"]
+        if record.get('process_peak_rss_bytes') is not None:
+            parts.append(f"process peak RSS {record['process_peak_rss_bytes'] / 1e6:.1f} MB "
+                         f"(+{record['peak_rss_growth_bytes'] / 1e6:.1f} MB)")
+        if record.get('peak_traced_bytes') is not None:
+            parts.append(f"peak allocations {record['peak_traced_bytes'] / 1e6:.1f} MB")
+        if record.get('rows') is not None:
+            parts.append(f"{record['rows']} rows")
+        print(f"Stage {record['stage']}: {', '.join(parts)}")
+
+    # cProfile stats (binary, for snakeviz/pstats) plus a text summary of the hottest functions
+    # and of the allocation sites, per stage
+    def write_profile(self, name, profiler):
+        base = os.path.join(self.profile_dir, name)
+        profiler.dump_stats(f'{base}.prof')
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(25)
+        if tracemalloc.is_tracing():
+            summary.write('\nTop allocation sites (tracemalloc):\n')
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:15]:
+                summary.write(f'{stat}\n')
+        with open(f'{base}.txt', 'w', encoding='utf-8') as handle:
+            handle.write(summary.getvalue())
+
+    # Write the records as JSON lines (appended, one run after the other) or as a Prometheus
+    # textfile-collector file (replaced)
+    def write(self, path, metrics_format='jsonl'):
+        if metrics_format not in METRICS_FORMATS:
+            raise ValueError(f"Unknown metrics format '{metrics_format}', expected one of {', '.join(METRICS_FORMATS)}")
+        if metrics_format == 'jsonl':
+            with open(path, 'a', encoding='utf-8') as handle:
+                for record in self.records:
+                    handle.write(json.dumps({'run_started': self.run_started, **record}) + '\n')
+        else:
+            # Write next to the target and rename, so the collector never reads a partial file
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as handle:
+                handle.write(self.prometheus_text())
+            os.replace(f'{path}.tmp', path)
+        print(f"Metrics written to {path}")
+
+    # Gauges labelled by stage, in the Prometheus text exposition format
+    def prometheus_text(self):
+        lines = []
+        for field, (metric, help_text) in PROMETHEUS_METRICS.items():
+            samples = [record for record in self.records if record.get(field) is not None]
+            if not samples:
+                continue
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} gauge')
+            for record in samples:
+                labels = f'stage="{record["stage"]}",kind="{record["kind"]}"'
+                lines.append(f'{metric}{{{labels}}} {record[field]}')
+        return '\n'.join(lines) + '\n'
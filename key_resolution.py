@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from surrogate_keys import factorize_keys
+
+# Hash index from a dimension's natural key to its surrogate ID. Each key column is
+# factorized into integer codes and the codes are combined column by column, so resolving
+# a whole fact column is a handful of vectorized hash lookups instead of a DataFrame merge.
+class KeyIndex:
+    def __init__(self, dimension, key_columns, id_column):
+        self.name = id_column
+        self.key_columns = list(key_columns)
+        self.column_values = []
+        self.combined_values = []
+        codes = np.zeros(len(dimension), dtype='int64')
+        for column in self.key_columns:
+            column_codes, uniques = pd.factorize(dimension[column], use_na_sentinel=False)
+            codes, combined = pd.factorize(codes * len(uniques) + column_codes)
+            self.column_values.append(pd.Index(uniques))
+            self.combined_values.append(pd.Index(combined))
+
+        # A natural key must identify exactly one member, otherwise lookups would fan out
+        members_per_key = np.bincount(codes, minlength=len(self.combined_values[-1]))
+        if (members_per_key > 1).any():
+            duplicated = dimension.iloc[np.flatnonzero(members_per_key[codes] > 1)[:1]][self.key_columns]
+            example = dict(zip(self.key_columns, duplicated.iloc[0].tolist()))
+            raise ValueError(f"Ambiguous {id_column} lookup: {int((members_per_key > 1).sum())} natural keys "
+                             f"on {', '.join(self.key_columns)} match several members, e.g. {example}")
+        self.ids = np.empty(len(members_per_key), dtype='int64')
+        self.ids[codes] = dimension[id_column].to_numpy(dtype='int64')
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Surrogate ID for every row of frame, read from `columns` (defaults to the key columns).
+    # Rows whose key is not in the dimension raise unless required is False, in which case
+    # they resolve to NA.
+    def resolve(self, frame, columns=None, required=True):
+        columns = self.key_columns if columns is None else list(columns)
+        if len(columns) != len(self.key_columns):
+            raise ValueError(f"{self.name} lookup needs {len(self.key_columns)} columns, got {len(columns)}")
+        codes = np.zeros(len(frame), dtype='int64')
+        missing = np.zeros(len(frame), dtype=bool)
+        for column, values, combined in zip(columns, self.column_values, self.combined_values):
+            column_codes = values.get_indexer(frame[column])
+            missing |= column_codes < 0
+            codes = combined.get_indexer(np.where(missing, -1, codes * len(values) + column_codes))
+            missing |= codes < 0
+
+        if required and missing.any():
+            example = dict(zip(columns, frame[columns].iloc[np.flatnonzero(missing)[0]].tolist()))
+            raise ValueError(f"Unresolved {self.name} lookup: {int(missing.sum())} rows have no matching member, e.g. {example}")
+        ids = self.ids[np.where(missing, 0, codes)] if len(self.ids) else np.zeros(len(frame), dtype='int64')
+        return pd.arrays.IntegerArray(np.where(missing, 0, ids), missing)
+
+# Natural keys whose rows disagree on a non-key attribute, per attribute: {column: (number of
+# keys, example key)}. Missing values do not count as a disagreement. A dimension keeps the
+# first row of every key, so the other values of these attributes never reach the star schema.
+def conflicting_attributes(frame, key_columns, attribute_columns):
+    codes = factorize_keys(frame, key_columns)
+    conflicts = {}
+    for column in attribute_columns:
+        values, _ = pd.factorize(frame[column])
+        distinct = pd.Series(np.where(values >= 0, values, np.nan)).groupby(codes).nunique()
+        conflicting = distinct.index[distinct.to_numpy() > 1]
+        if len(conflicting):
+            example = frame[key_columns].iloc[int(np.flatnonzero(codes == conflicting[0])[0])]
+            conflicts[column] = (len(conflicting), dict(zip(key_columns, example.tolist())))
+    return conflicts
+
+# Print the conflicting attributes of a dimension, then return them
+def report_conflicts(frame, key_columns, attribute_columns, name):
+    conflicts = conflicting_attributes(frame, key_columns, attribute_columns)
+    for column, (keys, example) in conflicts.items():
+        print(f"Warning: {name}: {keys} natural keys have conflicting {column} values, the first row's "
+              f"value is kept (e.g. {example})")
+    return conflicts
+
+# One member per natural key, in order of first appearance; keys whose rows disagree on the
+# other columns are reported instead of being collapsed silently
+def dimension_members(frame, columns, key_columns, name):
+    report_conflicts(frame, key_columns, [column for column in columns if column not in key_columns], name)
+    return frame[columns].drop_duplicates(subset=key_columns).reset_index(drop=True)
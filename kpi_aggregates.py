@@ -0,0 +1,111 @@
+from sqlalchemy import Table, Column, Index, Integer, Float, select, text, bindparam
+
+from star_schema import schema_table
+
+# Tables a grain column can come from, joined to fact_subscription (f) under an alias: the
+# calendar of the start date, the calendar of the end date and the course offering
+GRAIN_JOINS = {
+    't': ('dim_time', 'JOIN', 't."TimeID" = f."StartTimeID"'),
+    'e': ('dim_time', 'LEFT JOIN', 'e."TimeID" = f."EndTimeID"'),
+    'o': ('dim_course_offering', 'JOIN', 'o."CourseOfferingID" = f."CourseOfferingID"'),
+}
+
+# Columns an aggregate can be grouped by -> (join alias, column): calendar attributes of the
+# subscription start and end dates and course offering attributes
+GRAIN_SOURCES = {
+    'Year': ('t', 'Year'),
+    'Quarter': ('t', 'Quarter'),
+    'YearMonth': ('t', 'YearMonth'),
+    'Cohort': ('t', 'Cohort'),
+    'EndYearMonth': ('e', 'YearMonth'),
+    'GroupName': ('o', 'GroupName'),
+    'SessionName': ('o', 'SessionName'),
+    'TrackName': ('o', 'TrackName'),
+    'Hackerspace': ('o', 'Hackerspace'),
+    'Country': ('o', 'Country'),
+    'ProductSchedule': ('o', 'ProductSchedule'),
+}
+
+# Aggregate tables kept up to date by the ETL, name -> grain. Every grain starts with the start
+# YearMonth so a month of subscriptions can be refreshed on its own. The completion table follows
+# each start-month cohort across the months its subscriptions end in.
+AGGREGATES = {
+    'agg_subscription_monthly': ['YearMonth', 'Country', 'TrackName', 'Hackerspace'],
+    'agg_subscription_completion': ['YearMonth', 'EndYearMonth'],
+}
+
+# Measures of every aggregate and their SQL over fact_subscription (f)
+MEASURES = {
+    'Subscriptions': (Integer, 'COUNT(*)'),
+    'Diplomas': (Integer, 'SUM(f."SubscriptionHasDiploma")'),
+    'TotalProgress': (Float, 'SUM(f."SubscriptionProgress")'),
+    'AvgProgress': (Float, 'AVG(f."SubscriptionProgress")'),
+    'DiplomaRate': (Float, 'AVG(f."SubscriptionHasDiploma")'),
+    'AvgDaysToDiploma': (Float, """AVG(TO_DATE(CAST(f."DiplomaTimeID" AS TEXT), 'YYYYMMDD') - """
+                                """TO_DATE(CAST(f."StartTimeID" AS TEXT), 'YYYYMMDD')) """
+                                """FILTER (WHERE f."SubscriptionHasDiploma" = 1)"""),
+}
+
+# Declare the aggregate tables on the star schema metadata, indexed on their grain
+def declare_aggregates(metadata, aggregates=None):
+    aggregates = AGGREGATES if aggregates is None else aggregates
+    for name, grain in aggregates.items():
+        if not grain or grain[0] != 'YearMonth':
+            raise ValueError(f"Aggregate {name} must be grouped by YearMonth first, got {grain}")
+        unknown = [column for column in grain if column not in GRAIN_SOURCES]
+        if unknown:
+            raise ValueError(f"Unknown grain columns for {name}: {', '.join(unknown)}")
+        sources = {}
+        for column in grain:
+            alias, source = GRAIN_SOURCES[column]
+            sources[column] = schema_table(metadata, GRAIN_JOINS[alias][0]).c[source]
+        table = Table(name, metadata,
+                      *[Column(column, sources[column].type) for column in grain],
+                      *[Column(measure, column_type) for measure, (column_type, _) in MEASURES.items()],
+                      info={'grain': list(grain)})
+        Index(f'ix_{name}_grain', *[table.c[column] for column in grain])
+
+# Aggregate tables declared on the metadata
+def aggregate_tables(metadata):
+    return [table for table in metadata.sorted_tables if 'grain' in table.info]
+
+# Recompute the aggregates from the loaded facts; with months (YYYYMM start months) only the rows
+# of those months are replaced, which is all an incremental load can change. An aggregate that
+# is still empty (e.g. added to an existing schema) is always computed in full.
+def refresh_aggregates(connection, metadata, months=None):
+    preparer = connection.dialect.identifier_preparer
+    quote = preparer.quote
+    fact = preparer.format_table(schema_table(metadata, 'fact_subscription'))
+    if months is not None:
+        months = sorted({int(month) for month in months})
+        if not months:
+            return
+        # The start key range lets PostgreSQL prune the fact partitions that are not touched
+        params = {'months': months, 'first_key': months[0] * 100 + 1, 'last_key': months[-1] * 100 + 31}
+
+    for table in aggregate_tables(metadata):
+        partial = months is not None and connection.execute(select(table).limit(1)).first() is not None
+        grain = table.info['grain']
+        target = preparer.format_table(table)
+        columns = [quote(column) for column in grain] + [quote(measure) for measure in MEASURES]
+        select_list = [f"{GRAIN_SOURCES[column][0]}.{quote(GRAIN_SOURCES[column][1])}" for column in grain]
+        # The start calendar is always joined, partial refreshes filter on it
+        aliases = ['t'] + sorted({GRAIN_SOURCES[column][0] for column in grain} - {'t'})
+        joins = [f"{GRAIN_JOINS[alias][1]} {preparer.format_table(schema_table(metadata, GRAIN_JOINS[alias][0]))} AS {alias} "
+                 f"ON {GRAIN_JOINS[alias][2]}" for alias in aliases]
+        where = 'WHERE t."YearMonth" IN :months AND f."StartTimeID" BETWEEN :first_key AND :last_key' if partial else ''
+        statement = text(
+            f"INSERT INTO {target} ({', '.join(columns)}) "
+            f"SELECT {', '.join(select_list + [sql for _, sql in MEASURES.values()])} "
+            f"FROM {fact} AS f {' '.join(joins)} "
+            f"{where} GROUP BY {', '.join(select_list)}")
+        if partial:
+            months_param = bindparam('months', expanding=True)
+            connection.execute(text(f'DELETE FROM {target} WHERE "YearMonth" IN :months').bindparams(months_param),
+                               {'months': months})
+            inserted = connection.execute(statement.bindparams(months_param), params).rowcount
+        else:
+            connection.execute(text(f"DELETE FROM {target}"))
+            inserted = connection.execute(statement).rowcount
+        scope = f"{len(months)} month(s)" if partial else 'all months'
+        print(f"Refreshed {table.name}: {inserted} rows for {scope}")
@@ -0,0 +1,168 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from cleaning import detect_encoding, read_subscriptions, validate_columns, fill_missing, apply_fills
+from date_parsing import DateParser
+from fill_statistics import FillStatistics, merge_fill_statistics
+from star_schema import NATURAL_KEYS, COURSE_OFFERING_KEY, DIMENSION_COLUMNS
+from key_resolution import KeyIndex, dimension_members
+from calendar_dimension import FACT_DATE_COLUMNS, date_keys, calendar_range, build_calendar
+
+# Partial dimension sets every worker returns: the first row of each natural key in its file.
+# Course offerings keep the natural key of the instructor of that row.
+PARTIAL_COLUMNS = {
+    'dim_instructor': (DIMENSION_COLUMNS['dim_instructor'], NATURAL_KEYS['dim_instructor']),
+    'dim_course_offering': (COURSE_OFFERING_KEY + NATURAL_KEYS['dim_instructor'], COURSE_OFFERING_KEY),
+    'dim_student': (DIMENSION_COLUMNS['dim_student'], NATURAL_KEYS['dim_student']),
+}
+
+# Fact columns pointing at rows of the partial dimensions of the same file
+LOCAL_KEYS = {'dim_course_offering': 'OfferingRow', 'dim_student': 'StudentRow'}
+
+# Whether --csv-path names several extracts (a directory or a glob) rather than one file
+def is_multi_input(path):
+    return os.path.isdir(path) or glob.has_magic(path)
+
+# Extracts named by a file, a directory (every *.csv in it) or a glob, in a stable order
+def expand_inputs(path):
+    if os.path.isdir(path):
+        paths = glob.glob(os.path.join(path, '*.csv'))
+    elif glob.has_magic(path):
+        paths = glob.glob(path)
+    else:
+        paths = [path] if os.path.exists(path) else []
+    paths = sorted(p for p in paths if os.path.isfile(p))
+    if not paths:
+        raise FileNotFoundError(f"Error: no CSV files match {path}.")
+    return paths
+
+# Worker: read, type and parse one extract and reduce it to partial dimensions and compact fact
+# rows. Values that need file-wide statistics (medians, modes) are left missing and filled once
+# all files are in; only the sketches of their columns come back.
+def transform_file(path):
+    started = time.perf_counter()
+    df = read_subscriptions(path, detect_encoding(path))
+    validate_columns(df.columns)
+    if df.empty:
+        raise ValueError(f"CSV file {path} has no rows.")
+    DateParser().parse_frame(df)
+    statistics = FillStatistics.from_frame(df)
+    start_dates = df['SubscriptionStartDate'].dropna()
+    apply_fills(df, {})
+
+    # Conflicting attributes within the file are reported here, those across files by merge_partials
+    partials, local_rows = {}, {}
+    for name, (columns, key) in PARTIAL_COLUMNS.items():
+        partial = dimension_members(df, columns, key, f'{name} in {path}')
+        partial['LocalRow'] = np.arange(len(partial))
+        partials[name] = partial
+        if name in LOCAL_KEYS:
+            local_rows[LOCAL_KEYS[name]] = KeyIndex(partial, key, 'LocalRow').resolve(df).to_numpy(dtype='int64')
+    facts = pd.DataFrame({
+        **local_rows,
+        **{key: date_keys(df[col]) for key, col in FACT_DATE_COLUMNS.items()},
+        'SubscriptionProgress': df['SubscriptionProgress'].to_numpy(),
+        'SubscriptionHasDiploma': df['SubscriptionHasDiploma'].to_numpy(),
+    })
+    dates = pd.concat([df[col] for col in FACT_DATE_COLUMNS.values()]).dropna()
+    return {
+        'path': path,
+        'rows': len(df),
+        'statistics': statistics,
+        'last_start_date': start_dates.max().to_pydatetime() if len(start_dates) else None,
+        'date_bounds': dates.agg(['min', 'max']) if len(dates) else pd.Series(dtype='datetime64[us]'),
+        'partials': partials,
+        'facts': facts,
+        'seconds': time.perf_counter() - started,
+    }
+
+# Run transform_file over every extract in a process pool. A file that fails is reported and
+# left out; the others are returned in input order.
+def transform_files(paths, workers=None):
+    results, failures = {}, {}
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(paths))) as pool:
+        futures = {pool.submit(transform_file, path): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures[path] = e
+                print(f"Skipping {path}: {e}")
+                continue
+            results[path] = result
+            print(f"Transformed {result['rows']} rows of {path} in {result['seconds']:.2f}s")
+    if not results:
+        raise RuntimeError(f"All {len(paths)} input files failed")
+    return [results[path] for path in paths if path in results], failures
+
+# Merge the partial dimensions of all files into one surrogate key space, in file order, so the
+# star schema is the one a single run over the concatenated files would build
+def merge_partials(results, calendar_start=None, calendar_end=None):
+    fill_values = merge_fill_statistics(result['statistics'] for result in results).fill_values()
+    partials = {}
+    for name in PARTIAL_COLUMNS:
+        partials[name] = [fill_missing(result['partials'][name].copy(), fill_values) for result in results]
+
+    def merged(name, columns, key):
+        frame = pd.concat([partial[columns] for partial in partials[name]], ignore_index=True)
+        return dimension_members(frame, columns, key, f'{name} across files')
+
+    dim_instructor = merged('dim_instructor', *PARTIAL_COLUMNS['dim_instructor'])
+    dim_instructor['InstructorID'] = dim_instructor.index + 1
+    instructor_index = KeyIndex(dim_instructor, NATURAL_KEYS['dim_instructor'], 'InstructorID')
+
+    dim_course_offering = merged('dim_course_offering', *PARTIAL_COLUMNS['dim_course_offering'])
+    dim_course_offering['InstructorID'] = instructor_index.resolve(dim_course_offering)
+    dim_course_offering = dim_course_offering[COURSE_OFFERING_KEY + ['InstructorID']]
+    dim_course_offering['CourseOfferingID'] = dim_course_offering.index + 1
+    course_offering_index = KeyIndex(dim_course_offering, COURSE_OFFERING_KEY, 'CourseOfferingID')
+
+    dim_student = merged('dim_student', *PARTIAL_COLUMNS['dim_student'])
+    dim_student['StudentID'] = dim_student.index + 1
+    student_index = KeyIndex(dim_student, NATURAL_KEYS['dim_student'], 'StudentID')
+
+    # Facts: local partial rows become global surrogate IDs, missing dates get the filled key
+    fill_keys = {key: date_keys(pd.Series([fill_values[col]]))[0] if fill_values[col] is not None else None
+                 for key, col in FACT_DATE_COLUMNS.items()}
+    facts, date_bounds, next_subscription_id = [], [], 1
+    for result, offerings, students in zip(results, partials['dim_course_offering'], partials['dim_student']):
+        fact = result['facts']
+        offering_ids = course_offering_index.resolve(offerings).to_numpy(dtype='int64')
+        student_ids = student_index.resolve(students).to_numpy(dtype='int64')
+        time_ids = {}
+        for key, col in FACT_DATE_COLUMNS.items():
+            keys = fact[key]
+            if fill_keys[key] is not None and keys.isna().any():
+                keys = keys.fillna(fill_keys[key])
+                date_bounds.append(pd.Series([fill_values[col]]))
+            time_ids[key] = keys.array
+        facts.append(pd.DataFrame({
+            'SubscriptionID': np.arange(next_subscription_id, next_subscription_id + len(fact)),
+            'CourseOfferingID': offering_ids[fact['OfferingRow'].to_numpy()],
+            'StudentID': student_ids[fact['StudentRow'].to_numpy()],
+            **time_ids,
+            'SubscriptionProgress': fact['SubscriptionProgress'].to_numpy(),
+            'SubscriptionHasDiploma': fact['SubscriptionHasDiploma'].to_numpy(),
+        }))
+        next_subscription_id += len(fact)
+        date_bounds.append(result['date_bounds'])
+
+    dim_time = build_calendar(*calendar_range([pd.concat(date_bounds, ignore_index=True)], calendar_start, calendar_end))
+    return {
+        'dim_student': dim_student,
+        'dim_instructor': dim_instructor,
+        'dim_course_offering': dim_course_offering,
+        'dim_time': dim_time,
+        'fact_subscription': pd.concat(facts, ignore_index=True),
+    }
+
+# Watermark of every loaded file, so each can later be loaded incrementally on its own
+def file_watermarks(results, watermark_identity):
+    return [{**watermark_identity(result['path'], result['rows']), 'LastStartDate': result['last_start_date'], 'LastRow': result['rows']}
+            for result in results]
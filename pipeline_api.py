@@ -0,0 +1,150 @@
+import argparse
+import glob
+import importlib
+import os
+import shlex
+import shutil
+import sys
+import time
+from datetime import datetime
+
+# Entry points run_pipeline can drive, by short name. They pull in pandas, SQLAlchemy and the
+# rest of the ETL, so they are only imported on first use.
+PIPELINES = {'etl': 'etl_pipeline', 'export': 'export_flattened_csv'}
+
+DEFAULT_POLL_SECONDS = 2.0
+DEFAULT_SETTLE_SECONDS = 1.0
+
+# Where the watch worker moves the files of its inbox once they are done
+PROCESSED_DIR = 'processed'
+FAILED_DIR = 'failed'
+
+# The module of a pipeline, imported on first use
+def pipeline_module(pipeline='etl'):
+    if pipeline not in PIPELINES:
+        raise ValueError(f"Unknown pipeline '{pipeline}', expected one of {', '.join(PIPELINES)}")
+    return importlib.import_module(PIPELINES[pipeline])
+
+# Database configuration from the environment and the .env file
+def load_config():
+    from dotenv import load_dotenv
+    from db_config import validate_config
+    load_dotenv()
+    return validate_config()
+
+# Run a pipeline on source (a CSV file, directory or glob) and return its stage records.
+# config defaults to the environment; options are the command-line options of the pipeline by
+# name, e.g. run_pipeline(config, 'inbox/march.csv', mode='incremental').
+def run_pipeline(config=None, source=None, pipeline='etl', engine=None, **options):
+    module = pipeline_module(pipeline)
+    return module.run_pipeline(config or load_config(), source, engine=engine, **options)
+
+# Options of a pipeline from its command-line form, e.g. "--mode incremental --loader copy"
+def parse_pipeline_args(pipeline, argv):
+    options = vars(pipeline_module(pipeline).parser.parse_args(argv))
+    options.pop('csv_path')
+    return options
+
+# Resident worker: waits for CSV files to land in inbox and runs the pipeline on each, oldest
+# first, with the modules imported and the engine's connection pool kept warm between files.
+# Files default to incremental runs, so every file appends to the schema under its own watermark.
+# A file is picked up once it has not been modified for settle_seconds; producers should write
+# elsewhere and move the finished file in. Done files go to inbox/processed, failed ones to
+# inbox/failed next to a .error file with the message.
+class InboxWorker:
+    def __init__(self, inbox, pipeline='etl', config=None, poll_seconds=DEFAULT_POLL_SECONDS,
+                 settle_seconds=DEFAULT_SETTLE_SECONDS, **options):
+        if not os.path.isdir(inbox):
+            raise FileNotFoundError(f"Inbox directory {inbox} not found.")
+        self.inbox = os.path.abspath(inbox)
+        self.pipeline = pipeline
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self.options = {'mode': 'incremental', **options}
+        self.config = config or load_config()
+        started = time.perf_counter()
+        self.module = pipeline_module(pipeline)
+        from db_config import get_engine
+        # pool_pre_ping replaces connections the server closed while the worker was idle
+        self.engine = get_engine(self.config, pool_size=max(5, self.options.get('load_workers') or 0) + 1,
+                                 pool_pre_ping=True)
+        print(f"Worker ready in {time.perf_counter() - started:.2f}s, watching {self.inbox}")
+
+    # CSV files of the inbox that stopped changing, oldest first
+    def ready_files(self):
+        now = time.time()
+        paths = [path for path in glob.glob(os.path.join(self.inbox, '*.csv'))
+                 if os.path.isfile(path) and not os.path.basename(path).startswith('.')]
+        return sorted((path for path in paths if now - os.path.getmtime(path) >= self.settle_seconds),
+                      key=os.path.getmtime)
+
+    # Move a finished file into a subdirectory of the inbox without overwriting an earlier one
+    def archive(self, path, subdirectory):
+        directory = os.path.join(self.inbox, subdirectory)
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, os.path.basename(path))
+        if os.path.exists(target):
+            stem, extension = os.path.splitext(os.path.basename(path))
+            target = os.path.join(directory, f"{stem}.{datetime.now().strftime('%Y%m%dT%H%M%S%f')}{extension}")
+        shutil.move(path, target)
+        return target
+
+    # Run the pipeline on one file and archive it; True when it succeeded
+    def process(self, path):
+        started = time.perf_counter()
+        try:
+            self.module.run_pipeline(self.config, path, engine=self.engine, **self.options)
+        except Exception as e:
+            target = self.archive(path, FAILED_DIR)
+            with open(f'{target}.error', 'w', encoding='utf-8') as handle:
+                handle.write(f"{e}\n")
+            print(f"Failed on {os.path.basename(path)} after {time.perf_counter() - started:.2f}s: {e}", file=sys.stderr)
+            return False
+        self.archive(path, PROCESSED_DIR)
+        print(f"Processed {os.path.basename(path)} in {time.perf_counter() - started:.2f}s")
+        return True
+
+    # Poll the inbox until interrupted, or until it is empty with once
+    def run(self, once=False):
+        processed = failed = 0
+        try:
+            while True:
+                paths = self.ready_files()
+                for path in paths:
+                    if self.process(path):
+                        processed += 1
+                    else:
+                        failed += 1
+                if once and not paths:
+                    break
+                if not paths:
+                    time.sleep(self.poll_seconds)
+        except KeyboardInterrupt:
+            print("Stopping the worker.")
+        finally:
+            self.engine.dispose()
+        print(f"Worker done: {processed} file(s) processed, {failed} failed")
+        return processed, failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch an inbox directory and run the ETL on every subscription file that lands in it")
+    parser.add_argument('--inbox', type=str, required=True, help="Directory new CSV files are moved into")
+    parser.add_argument('--pipeline', choices=sorted(PIPELINES), default='etl', help="etl: load the star schema; export: also write the flattened extract")
+    parser.add_argument('--pipeline-args', type=str, default='', help="Options of the pipeline, e.g. \"--loader copy --batch-size 20000\" (default --mode incremental)")
+    parser.add_argument('--poll-seconds', type=float, default=DEFAULT_POLL_SECONDS, help="Pause between two looks at an empty inbox")
+    parser.add_argument('--settle-seconds', type=float, default=DEFAULT_SETTLE_SECONDS, help="How long a file must be unmodified before it is picked up")
+    parser.add_argument('--once', action='store_true', help="Process the files already in the inbox and exit")
+    args = parser.parse_args()
+    try:
+        pipeline_argv = shlex.split(args.pipeline_args)
+        options = parse_pipeline_args(args.pipeline, pipeline_argv)
+        if not any(arg == '--mode' or arg.startswith('--mode=') for arg in pipeline_argv):
+            options['mode'] = 'incremental'
+        worker = InboxWorker(args.inbox, pipeline=args.pipeline, poll_seconds=args.poll_seconds,
+                             settle_seconds=args.settle_seconds, **options)
+        _, failed = worker.run(once=args.once)
+    except Exception as e:
+        print(f"Worker failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    if failed and args.once:
+        sys.exit(2)
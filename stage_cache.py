@@ -0,0 +1,160 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # The cache stores its frames as Arrow IPC files
+    feather = None
+
+DEFAULT_CACHE_DIR = '.etl_cache'
+DEFAULT_MAX_MB = 2048
+
+# Modules whose code shapes the cached stages; a change to any of them gives new keys
+CLEANING_MODULES = ('cleaning', 'calendar_dimension', 'date_parsing', 'fill_statistics', 'incremental_load')
+STAR_SCHEMA_MODULES = ('star_schema', 'key_resolution', 'surrogate_keys', 'calendar_dimension')
+
+# File digests are remembered by path, size and modification time, so an unchanged input is
+# not read again just to be hashed
+DIGESTS_FILE = 'digests.json'
+META_FILE = 'meta.json'
+FRAME_EXTENSION = '.arrow'
+READ_BLOCK = 1 << 20
+
+# Hash of the source code of modules (by name) and functions
+def code_digest(modules=(), functions=()):
+    digest = hashlib.blake2b(digest_size=16)
+    for module in modules:
+        digest.update(inspect.getsource(importlib.import_module(module)).encode('utf-8'))
+    for function in functions:
+        digest.update(inspect.getsource(function).encode('utf-8'))
+    return digest.hexdigest()
+
+# Cache metadata is JSON; datetimes (watermarks) are tagged so they come back as datetimes
+def encode_value(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"Cannot store {type(value).__name__} in the stage cache metadata")
+
+def decode_value(value):
+    return datetime.fromisoformat(value['__datetime__']) if set(value) == {'__datetime__'} else value
+
+# On-disk cache of stage outputs. Every entry is a directory named by its key (a hash of
+# everything the stage read: input file, options, code) holding one Arrow IPC file per frame,
+# so dtypes (categoricals, nullable integers, dates) survive and reads are memory-mapped.
+# The least recently used entries are evicted once the cache grows past max_bytes.
+class StageCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        if feather is None:
+            raise RuntimeError("The stage cache needs pyarrow (pip install pyarrow)")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Key of a stage from the digests and options it depends on
+    @staticmethod
+    def key(*parts):
+        return hashlib.blake2b(json.dumps(parts, default=str).encode('utf-8'), digest_size=16).hexdigest()
+
+    # Content hash of a file, reused while its size and modification time are unchanged
+    def file_digest(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        digests_path = os.path.join(self.cache_dir, DIGESTS_FILE)
+        try:
+            with open(digests_path, encoding='utf-8') as handle:
+                digests = json.load(handle)
+        except (OSError, ValueError):
+            digests = {}
+        known = digests.get(path)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(READ_BLOCK), b''):
+                digest.update(block)
+        digests[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self.write_json(digests_path, digests)
+        return digests[path][2]
+
+    # Replace a JSON file in one rename, so a concurrent reader never sees half of it
+    @staticmethod
+    def write_json(path, value):
+        temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump(value, handle, default=encode_value)
+        os.replace(temporary, path)
+
+    # Frames (name -> DataFrame) and metadata of an entry, or None when it is not cached.
+    # A hit marks the entry as recently used.
+    def get(self, key):
+        entry = os.path.join(self.cache_dir, key)
+        meta_path = os.path.join(entry, META_FILE)
+        try:
+            with open(meta_path, encoding='utf-8') as handle:
+                meta = json.load(handle, object_hook=decode_value)
+            frames = {name: feather.read_table(os.path.join(entry, f'{name}{FRAME_EXTENSION}'), memory_map=True).to_pandas()
+                      for name in meta['frames']}
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.isdir(entry):
+                print(f"Ignoring unreadable cache entry {key}: {e}")
+            return None
+        os.utime(meta_path)
+        return frames, meta['details']
+
+    # Store frames with their metadata under key, then evict what no longer fits
+    def put(self, key, frames, details=None):
+        entry = os.path.join(self.cache_dir, key)
+        staging = os.path.join(self.cache_dir, f'{key}.{uuid.uuid4().hex}.tmp')
+        os.makedirs(staging)
+        try:
+            for name, frame in frames.items():
+                # Arrow IPC files keep columns only; the frames are rebuilt with a fresh RangeIndex
+                feather.write_feather(frame.reset_index(drop=True), os.path.join(staging, f'{name}{FRAME_EXTENSION}'))
+            self.write_json(os.path.join(staging, META_FILE), {'frames': list(frames), 'details': details or {},
+                                                               'created': datetime.now()})
+            size = directory_size(staging)
+            if size > self.max_bytes:
+                print(f"Not caching {key}: {size / 1e6:.1f} MB is more than the {self.max_bytes / 1e6:.1f} MB cache")
+                return False
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+            os.replace(staging, entry)
+        finally:
+            if os.path.isdir(staging):
+                shutil.rmtree(staging)
+        self.evict(keep=key)
+        return True
+
+    # Entries as (last used, size, key), least recently used first
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            meta_path = os.path.join(self.cache_dir, name, META_FILE)
+            if name.endswith('.tmp') or not os.path.isfile(meta_path):
+                continue
+            entries.append((os.path.getmtime(meta_path), directory_size(os.path.join(self.cache_dir, name)), name))
+        return sorted(entries)
+
+    # Remove the least recently used entries until the cache fits in max_bytes
+    def evict(self, keep=None):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+            print(f"Evicted cache entry {name} ({size / 1e6:.1f} MB)")
+        return total
+
+# Total size of the files in a directory
+def directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
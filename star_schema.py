@@ -0,0 +1,119 @@
+from sqlalchemy import MetaData, Table, Column, Index, Integer, String, Float, Text, DateTime, ForeignKey
+
+# Business identity of each dimension member: dimensions hold one member per natural key and
+# surrogate IDs are looked up through it
+NATURAL_KEYS = {
+    'dim_student': ['Student', 'BirthDateKey'],
+    'dim_instructor': ['InstructorFullName', 'InstructorEmail'],
+    'dim_course_offering': ['GroupName', 'SessionName', 'TrackName', 'Hackerspace', 'Country', 'ProductSchedule'],
+}
+
+# Tables whose primary key is a deterministic smart key (dim_time: YYYYMMDD); their rows are
+# inserted when missing and never renumbered
+SMART_KEY_TABLES = ['dim_time']
+
+COURSE_OFFERING_KEY = NATURAL_KEYS['dim_course_offering']
+
+# Source columns copied into each dimension; non-key columns come from the member's first row
+DIMENSION_COLUMNS = {
+    'dim_student': ['Student', 'StudentGender', 'StudentBirthDate', 'BirthDateKey', 'professionalExperience', 'Industry'],
+    'dim_instructor': ['InstructorFullName', 'InstructorEmail', 'instructor_diploma'],
+    'dim_course_offering': COURSE_OFFERING_KEY,
+}
+
+WATERMARK_TABLE = 'etl_watermark'
+FILL_STATISTICS_TABLE = 'etl_fill_statistics'
+
+# Column fact_subscription is range-partitioned on when partitioning is enabled (yearly partitions)
+FACT_PARTITION_KEY = 'StartTimeID'
+
+# Look up a table of the star schema by its bare name
+def schema_table(metadata, name):
+    key = f'{metadata.schema}.{name}' if metadata.schema else name
+    return metadata.tables[key]
+
+# Index every foreign key of a table: BRIN for keys into smart-keyed tables (time keys grow with
+# the load order, so a few block ranges cover a date filter), B-tree for dimension lookups
+def index_foreign_keys(table):
+    for foreign_key in table.foreign_keys:
+        column = foreign_key.parent
+        using = 'brin' if foreign_key.column.table.name in SMART_KEY_TABLES else 'btree'
+        Index(f'ix_{table.name}_{column.name}', column, postgresql_using=using)
+
+# Star schema table definitions shared by the ETL entry points. With partition_facts,
+# fact_subscription is declared as range-partitioned by start date; its partitions are created
+# when facts are loaded (table_layout.ensure_partitions).
+def build_metadata(schema, partition_facts=False):
+    metadata = MetaData(schema=schema)
+
+    # Dimension Tables
+    Table('dim_student', metadata,
+          Column('StudentID', Integer, primary_key=True),
+          Column('Student', String),
+          Column('StudentGender', String),
+          Column('StudentBirthDate', DateTime),  # Imputed when missing
+          Column('BirthDateKey', Integer, nullable=False),  # Birth date as read (YYYYMMDD, 0 when missing), part of the natural key
+          Column('professionalExperience', Integer),
+          Column('Industry', String))
+
+    Table('dim_instructor', metadata,
+          Column('InstructorID', Integer, primary_key=True),
+          Column('InstructorFullName', String),
+          Column('InstructorEmail', String),
+          Column('instructor_diploma', String))
+
+    Table('dim_course_offering', metadata,
+          Column('CourseOfferingID', Integer, primary_key=True),
+          Column('GroupName', String),
+          Column('SessionName', String),
+          Column('TrackName', String),
+          Column('Hackerspace', String),
+          Column('Country', String),
+          Column('ProductSchedule', String),
+          Column('InstructorID', Integer, ForeignKey(f'{schema}.dim_instructor.InstructorID')))
+
+    # Calendar dimension: one row per day, TimeID is the date as a YYYYMMDD integer
+    Table('dim_time', metadata,
+          Column('TimeID', Integer, primary_key=True, autoincrement=False),
+          Column('Date', DateTime),
+          Column('Year', Integer),
+          Column('Quarter', Integer),
+          Column('Month', Integer),
+          Column('Week', Integer),  # ISO week number
+          Column('Weekday', Integer),  # ISO weekday, 1 = Monday
+          Column('Day', Integer),
+          Column('YearMonth', Integer),  # Cohort key, e.g. 202401
+          Column('Cohort', String))  # Cohort label, e.g. '2024-01'
+
+    # Fact Table; a partitioned table's primary key has to include the partition key
+    partitioning = {'postgresql_partition_by': f'RANGE ("{FACT_PARTITION_KEY}")',
+                    'info': {'partition_key': FACT_PARTITION_KEY}} if partition_facts else {}
+    Table('fact_subscription', metadata,
+          Column('SubscriptionID', Integer, primary_key=True),
+          Column('CourseOfferingID', Integer, ForeignKey(f'{schema}.dim_course_offering.CourseOfferingID')),
+          Column('StudentID', Integer, ForeignKey(f'{schema}.dim_student.StudentID')),
+          Column('StartTimeID', Integer, ForeignKey(f'{schema}.dim_time.TimeID'), primary_key=partition_facts),
+          Column('EndTimeID', Integer, ForeignKey(f'{schema}.dim_time.TimeID')),
+          Column('DiplomaTimeID', Integer, ForeignKey(f'{schema}.dim_time.TimeID')),
+          Column('SubscriptionProgress', Float),  # Stored as 0 to 1
+          Column('SubscriptionHasDiploma', Integer),  # Stored as 0 or 1
+          **partitioning)
+
+    # Control table: how far each source file has been loaded, per extract delivered under its name
+    Table(WATERMARK_TABLE, metadata,
+          Column('Source', String, primary_key=True),
+          Column('Fingerprint', String, primary_key=True),  # Hash of the header and first rows (incremental_load.file_fingerprint)
+          Column('LastStartDate', DateTime),  # Highest SubscriptionStartDate loaded so far
+          Column('LastRow', Integer),  # Number of file rows already processed
+          Column('RowsLoaded', Integer),
+          Column('LoadedAt', DateTime))
+
+    # Control table: imputation sketches of every row loaded so far, one per fill column
+    Table(FILL_STATISTICS_TABLE, metadata,
+          Column('Column', String, primary_key=True),
+          Column('State', Text),  # JSON sketch (fill_statistics)
+          Column('UpdatedAt', DateTime))
+
+    for table in metadata.tables.values():
+        index_foreign_keys(table)
+    return metadata
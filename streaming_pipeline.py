@@ -0,0 +1,197 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from bulk_loader import LOADERS, DEFAULT_BATCH_SIZE, report_load
+from cleaning import DATE_COLUMNS, detect_encoding, read_subscription_chunks, validate_columns, apply_fills
+from date_parsing import DateParser
+from fill_statistics import FillStatistics
+from star_schema import NATURAL_KEYS, DIMENSION_COLUMNS
+from surrogate_keys import SurrogateKeyMap
+from table_layout import create_partitions
+from calendar_dimension import FACT_DATE_COLUMNS, date_keys, calendar_range, build_calendar
+
+DEFAULT_CHUNK_SIZE = 100000
+
+# Iterate over the extract chunk_size rows at a time, typed like a whole-file read
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    yield from read_subscription_chunks(path, detect_encoding(path), chunk_size)
+
+# Whether a parsed date column holds any value that is not at midnight
+def has_time_of_day(values):
+    values = values.dropna()
+    return bool((values != values.dt.normalize()).any())
+
+# First pass over the extract: column check, date formats, file-wide imputation statistics
+# and the inputs of the watermark. Only the merged sketches of the chunks are kept, never the
+# rows themselves; the date parser keeps its parsed strings for the second pass.
+def scan_subscriptions(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    date_parser = DateParser()
+    statistics = FillStatistics()
+    rows = 0
+    last_start = None
+    null_dates = dict.fromkeys(DATE_COLUMNS, 0)
+    timed_columns = set()
+    date_bounds = []
+    for chunk in read_chunks(path, chunk_size):
+        validate_columns(chunk.columns)
+        date_parser.parse_frame(chunk)
+        statistics = statistics.merge(FillStatistics.from_frame(chunk))
+        rows += len(chunk)
+
+        chunk_start = chunk['SubscriptionStartDate'].max()
+        if pd.notna(chunk_start) and (last_start is None or chunk_start > last_start):
+            last_start = chunk_start
+        for col in DATE_COLUMNS:
+            null_dates[col] += int(chunk[col].isna().sum())
+            if has_time_of_day(chunk[col]):
+                timed_columns.add(col)
+        date_bounds += [chunk[col].dropna().agg(['min', 'max']) for col in FACT_DATE_COLUMNS.values() if chunk[col].notna().any()]
+    if rows == 0:
+        raise ValueError(f"CSV file {path} has no rows.")
+    date_parser.report()
+
+    fill_values = statistics.fill_values()
+    # Imputed dates land in dim_time as well
+    date_bounds += [pd.Series([fill_values[col]]) for col in FACT_DATE_COLUMNS.values() if fill_values[col] is not None and null_dates[col]]
+    for col in DATE_COLUMNS:
+        if null_dates[col] and fill_values[col] is not None and fill_values[col] != fill_values[col].normalize():
+            timed_columns.add(col)
+    return {
+        'rows': rows,
+        'date_parser': date_parser,
+        'fill_statistics': statistics,
+        'fill_values': fill_values,
+        'last_start_date': None if last_start is None else last_start.to_pydatetime(),
+        'timed_columns': timed_columns,
+        'date_bounds': pd.concat(date_bounds, ignore_index=True) if date_bounds else pd.Series(dtype='datetime64[us]'),
+    }
+
+# Watermark for a source that was loaded by the streaming pipeline (identity: its source and fingerprint)
+def stream_watermark(identity, scan):
+    return {**identity, 'LastStartDate': scan['last_start_date'], 'LastRow': scan['rows']}
+
+# Streaming counterpart of key_resolution.report_conflicts: remembers the attributes every
+# member was introduced with and counts the members whose later rows, in the same or a later
+# chunk, disagree on one of them. Missing values do not count as a disagreement.
+class AttributeConflicts:
+    def __init__(self, name, columns):
+        self.name = name
+        self.columns = list(columns)
+        self.first_values = {}
+        self.conflicts = {column: set() for column in self.columns}
+
+    def update(self, chunk, ids):
+        rows = chunk[self.columns].assign(MemberID=ids).drop_duplicates()
+        for *values, member in rows.itertuples(index=False, name=None):
+            first = self.first_values.setdefault(member, values)
+            if first is values:
+                continue
+            for position, (column, old, new) in enumerate(zip(self.columns, first, values)):
+                if pd.isna(old):
+                    first[position] = new
+                elif not pd.isna(new) and old != new:
+                    self.conflicts[column].add(member)
+
+    def report(self):
+        for column, members in self.conflicts.items():
+            if members:
+                print(f"Warning: {self.name}: {len(members)} natural keys have conflicting {column} values, "
+                      f"the first row's value is kept (e.g. member {min(members)})")
+
+# New dimension members of a chunk, one row per newly assigned surrogate ID
+def member_frame(chunk, columns, new_rows, id_column, ids):
+    members = chunk.iloc[new_rows][columns].reset_index(drop=True)
+    members[id_column] = ids[new_rows]
+    return members
+
+# Second pass: clean every chunk with the file-wide fill values and resolve its surrogate keys
+# through maps that persist across chunks. Yields, per chunk, the new dimension members and
+# fact rows to load, and the cleaned chunk with its resolved keys. The calendar covering the
+# scanned date range goes out with the first chunk.
+def stream_star_schema(path, scan, chunk_size=DEFAULT_CHUNK_SIZE, calendar_start=None, calendar_end=None):
+    instructors = SurrogateKeyMap(NATURAL_KEYS['dim_instructor'])
+    offerings = SurrogateKeyMap(NATURAL_KEYS['dim_course_offering'])
+    students = SurrogateKeyMap(NATURAL_KEYS['dim_student'])
+    dim_time = build_calendar(*calendar_range([scan['date_bounds']], calendar_start, calendar_end))
+    offering_instructor = {}
+    student_attributes = [col for col in DIMENSION_COLUMNS['dim_student'] if col not in NATURAL_KEYS['dim_student']]
+    student_values = {col: {} for col in student_attributes}
+    conflicts = [
+        AttributeConflicts('dim_instructor', [col for col in DIMENSION_COLUMNS['dim_instructor'] if col not in NATURAL_KEYS['dim_instructor']]),
+        AttributeConflicts('dim_course_offering', NATURAL_KEYS['dim_instructor']),
+        AttributeConflicts('dim_student', student_attributes),
+    ]
+    next_subscription_id = 1
+
+    for chunk in read_chunks(path, chunk_size):
+        scan['date_parser'].parse_frame(chunk)
+        apply_fills(chunk, scan['fill_values'])
+        n_rows = len(chunk)
+
+        instructor_ids, new_rows = instructors.assign(chunk)
+        dim_instructor = member_frame(chunk, DIMENSION_COLUMNS['dim_instructor'], new_rows, 'InstructorID', instructor_ids)
+
+        # A course offering references the instructor of the row that introduced it
+        offering_ids, new_rows = offerings.assign(chunk)
+        dim_course_offering = member_frame(chunk, DIMENSION_COLUMNS['dim_course_offering'], new_rows, 'CourseOfferingID', offering_ids)
+        dim_course_offering['InstructorID'] = instructor_ids[new_rows]
+        offering_instructor.update(zip(offering_ids[new_rows].tolist(), instructor_ids[new_rows].tolist()))
+
+        student_ids, new_rows = students.assign(chunk)
+        for tracker, ids in zip(conflicts, (instructor_ids, offering_ids, student_ids)):
+            tracker.update(chunk, ids)
+        dim_student = member_frame(chunk, DIMENSION_COLUMNS['dim_student'], new_rows, 'StudentID', student_ids)
+        for col in student_attributes:
+            student_values[col].update(zip(dim_student['StudentID'].tolist(), dim_student[col].tolist()))
+
+        # Start, end and diploma dates key into the calendar directly; missing dates stay NA
+        time_ids = {key: date_keys(chunk[col]) for key, col in FACT_DATE_COLUMNS.items()}
+
+        fact_subscription = pd.DataFrame({
+            'SubscriptionID': np.arange(next_subscription_id, next_subscription_id + n_rows),
+            'CourseOfferingID': offering_ids,
+            'StudentID': student_ids,
+            **time_ids,
+            'SubscriptionProgress': chunk['SubscriptionProgress'].to_numpy(),
+            'SubscriptionHasDiploma': chunk['SubscriptionHasDiploma'].to_numpy(),
+        })
+        next_subscription_id += n_rows
+
+        # Resolved rows carry their student member's attributes, like a join with dim_student would
+        resolved = chunk.assign(
+            CourseOfferingID=offering_ids,
+            StudentID=student_ids,
+            InstructorID=pd.Series(offering_ids).map(offering_instructor).to_numpy(),
+            **time_ids,
+            **{col: pd.Series(student_ids).map(student_values[col]).to_numpy() for col in student_attributes},
+        )
+        frames = {
+            'dim_student': dim_student,
+            'dim_instructor': dim_instructor,
+            'dim_course_offering': dim_course_offering,
+            'dim_time': dim_time,
+            'fact_subscription': fact_subscription,
+        }
+        dim_time = dim_time.iloc[:0]
+        yield frames, resolved
+    for tracker in conflicts:
+        tracker.report()
+
+# Load chunk after chunk, each chunk's dimensions before its facts, and report totals per table
+def load_stream(engine, metadata, batches, loader='copy', batch_size=DEFAULT_BATCH_SIZE, copy_format='csv'):
+    if loader not in LOADERS:
+        raise ValueError(f"Unknown loader '{loader}', expected one of {', '.join(LOADERS)}")
+    totals = {}
+    for frames in batches:
+        for table in metadata.sorted_tables:
+            frame = frames.get(table.name)
+            if frame is None or frame.empty:
+                continue
+            started = time.perf_counter()
+            create_partitions(engine, table, frame)
+            LOADERS[loader](engine, table, frame, batch_size=batch_size, copy_format=copy_format)
+            rows, seconds = totals.get(table.name, (0, 0.0))
+            totals[table.name] = (rows + len(frame), seconds + time.perf_counter() - started)
+    return [report_load(name, loader, rows, seconds) for name, (rows, seconds) in totals.items()]
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+# Integer code per row for a (multi-column) key, numbered in order of first appearance.
+# Missing values form their own key value, like drop_duplicates and merge treat them.
+def factorize_keys(frame, columns):
+    codes = np.zeros(len(frame), dtype='int64')
+    for column in columns:
+        column_codes, uniques = pd.factorize(frame[column], use_na_sentinel=False)
+        codes, _ = pd.factorize(codes * max(len(uniques), 1) + column_codes)
+    return codes.astype('int64')
+
+# Position of the first row of every key code
+def first_occurrences(codes):
+    return np.unique(codes, return_index=True)[1]
+
+# Hashable form of a key tuple; NaN/NaT never compare equal, so they become None
+def normalize_key(key):
+    return tuple(None if pd.isna(value) else value for value in key)
+
+# Natural key -> surrogate ID map that persists across chunks, so IDs are assigned
+# once per member no matter how the input is split
+class SurrogateKeyMap:
+    def __init__(self, columns, first_id=1):
+        self.columns = list(columns)
+        self.ids = {}
+        self.next_id = first_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Surrogate ID for every row, plus the positions of the rows that introduced new members
+    def assign(self, frame):
+        codes = factorize_keys(frame, self.columns)
+        first_rows = first_occurrences(codes)
+        keys = frame[self.columns].iloc[first_rows]
+        group_ids = np.empty(len(first_rows), dtype='int64')
+        new_groups = []
+        for group, key in enumerate(keys.itertuples(index=False, name=None)):
+            key = normalize_key(key)
+            member_id = self.ids.get(key)
+            if member_id is None:
+                member_id = self.ids[key] = self.next_id
+                self.next_id += 1
+                new_groups.append(group)
+            group_ids[group] = member_id
+        return group_ids[codes], first_rows[new_groups]
@@ -0,0 +1,152 @@
+import argparse
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+SOURCE_CSV = 'Functional Task - OLTP_Subscription.csv'
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_NULL_RATE = 0.01
+
+# Columns that describe a course offering; they are drawn together, weighted by how many
+# subscriptions the offering has in the source extract
+OFFERING_COLUMNS = ['SessionName', 'TrackName', 'Hackerspace', 'Country', 'GroupName', 'ProductSchedule',
+                    'InstructorFullName', 'InstructorEmail', 'SubscriptionStartDate', 'SubscriptionEndDate']
+
+# Per-subscription columns drawn independently from their source frequencies
+CATEGORICAL_COLUMNS = ['StudentGender', 'Industry', 'professionalExperience']
+
+# Columns that can be blanked with --null-rate on top of the nulls the source already has
+NULLABLE_COLUMNS = ['StudentGender', 'Industry', 'StudentBirthDate', 'SubscriptionEndDate']
+
+# How the OLTP export writes missing values and diploma flags
+NULL_VALUE = 'null'
+DIPLOMA_FLAGS = {True: 'TRUE', False: 'FALSE'}
+
+# Diploma dates come either as ISO dates or as unpadded month/day/year (2/11/2024)
+DIPLOMA_DATE_STYLES = ['iso', 'us']
+
+# Parse a date column written in either diploma date style; missing values become NaT
+def parse_mixed_dates(values):
+    iso = pd.to_datetime(values, format='%Y-%m-%d', errors='coerce')
+    return iso.fillna(pd.to_datetime(values, format='%m/%d/%Y', errors='coerce'))
+
+# Values and their relative frequencies
+def frequencies(values):
+    counts = pd.Series(values).value_counts()
+    return counts.index.to_numpy(), (counts / counts.sum()).to_numpy()
+
+# Distributions of the source extract that the generator reproduces
+def build_profile(path=SOURCE_CSV):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Source CSV not found: {path}")
+    df = pd.read_csv(path, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+    missing = [col for col in OFFERING_COLUMNS + CATEGORICAL_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Source CSV misses columns: {', '.join(missing)}")
+
+    offerings = df.groupby(OFFERING_COLUMNS).size().rename('weight').reset_index()
+    has_diploma = df['SubscriptionHasDiploma'].str.upper() == 'TRUE'
+    diplomas = df[has_diploma & (df['DiplomaDate'] != NULL_VALUE)]
+    delays = (parse_mixed_dates(diplomas['DiplomaDate']) - pd.to_datetime(diplomas['SubscriptionEndDate'])).dt.days.dropna()
+    us_style = diplomas['DiplomaDate'].str.contains('/').mean() if len(diplomas) else 0.0
+    names = df['Student'].str.split()
+    birth_dates = df.loc[df['StudentBirthDate'] != NULL_VALUE, 'StudentBirthDate']
+    return {
+        'columns': list(df.columns),
+        'rows': len(df),
+        'offerings': offerings[OFFERING_COLUMNS],
+        'offering_weights': (offerings['weight'] / offerings['weight'].sum()).to_numpy(),
+        # Instructor diploma references are shared by the diplomas of an offering
+        'diploma_references': np.array([str(uuid.uuid5(uuid.NAMESPACE_OID, '|'.join(key)))
+                                        for key in offerings[OFFERING_COLUMNS].itertuples(index=False)]),
+        'categorical': {col: frequencies(df[col]) for col in CATEGORICAL_COLUMNS},
+        'diploma_rate': has_diploma.mean(),
+        'progress': {flag: frequencies(df.loc[has_diploma == flag, 'SubscriptionProgress']) for flag in (True, False)},
+        'diploma_delays': frequencies(delays.astype(int)),
+        'diploma_styles': np.array([1 - us_style, us_style]),
+        'first_names': names.str[0].dropna().unique(),
+        'last_names': names.str[-1].dropna().unique(),
+        'birth_dates': frequencies(birth_dates),
+        'birth_date_null_rate': 1 - len(birth_dates) / len(df),
+    }
+
+# Unpadded month/day/year strings of a DatetimeIndex
+def us_dates(dates):
+    return (pd.Series(dates.month).astype(str) + '/' + pd.Series(dates.day).astype(str) + '/'
+            + pd.Series(dates.year).astype(str)).to_numpy()
+
+# One chunk of synthetic subscriptions in the raw OLTP format. Every replica of the source gets
+# its own copy of each group (GroupName suffixed with the replica number), so offerings grow with
+# the row count while tracks, hackerspaces and countries keep their source cardinality.
+def generate_chunk(profile, rows, rng, replicas=1, null_rate=0.0):
+    offering_index = rng.choice(len(profile['offerings']), size=rows, p=profile['offering_weights'])
+    chunk = profile['offerings'].iloc[offering_index].reset_index(drop=True)
+    replica = rng.integers(0, replicas, size=rows)
+    chunk['GroupName'] = np.where(replica == 0, chunk['GroupName'], chunk['GroupName'] + ' ' + replica.astype(str))
+
+    for col, (values, weights) in profile['categorical'].items():
+        chunk[col] = rng.choice(values, size=rows, p=weights)
+    chunk['Student'] = (rng.choice(profile['first_names'], size=rows).astype(object) + ' '
+                        + rng.choice(profile['last_names'], size=rows).astype(object))
+    birth_values, birth_weights = profile['birth_dates']
+    chunk['StudentBirthDate'] = np.where(rng.random(rows) < profile['birth_date_null_rate'], NULL_VALUE,
+                                         rng.choice(birth_values, size=rows, p=birth_weights))
+
+    # Diplomas: flag, progress and a delay after the end date like the source
+    has_diploma = rng.random(rows) < profile['diploma_rate']
+    chunk['SubscriptionHasDiploma'] = np.where(has_diploma, DIPLOMA_FLAGS[True], DIPLOMA_FLAGS[False])
+    progress = np.empty(rows, dtype=object)
+    for flag in (True, False):
+        values, weights = profile['progress'][flag]
+        mask = has_diploma == flag
+        progress[mask] = rng.choice(values, size=int(mask.sum()), p=weights)
+    chunk['SubscriptionProgress'] = progress
+    delay_values, delay_weights = profile['diploma_delays']
+    diploma_dates = pd.DatetimeIndex(pd.to_datetime(chunk['SubscriptionEndDate'])
+                                     + pd.to_timedelta(rng.choice(delay_values, size=rows, p=delay_weights), unit='D'))
+    style = rng.choice(len(DIPLOMA_DATE_STYLES), size=rows, p=profile['diploma_styles'])
+    formatted = np.where(style == DIPLOMA_DATE_STYLES.index('us'), us_dates(diploma_dates),
+                         diploma_dates.strftime('%Y-%m-%d').to_numpy())
+    chunk['DiplomaDate'] = np.where(has_diploma, formatted, NULL_VALUE)
+    chunk['instructor_diploma'] = np.where(has_diploma, profile['diploma_references'][offering_index], NULL_VALUE)
+
+    if null_rate > 0:
+        for col in NULLABLE_COLUMNS:
+            chunk.loc[rng.random(rows) < null_rate, col] = NULL_VALUE
+    return chunk[profile['columns']]
+
+# Write rows synthetic subscriptions to path chunk by chunk; the same seed gives the same file
+def write_synthetic_csv(path, rows, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, null_rate=DEFAULT_NULL_RATE, profile=None, source=SOURCE_CSV):
+    if rows <= 0:
+        raise ValueError(f"Row count must be positive, got {rows}")
+    profile = profile or build_profile(source)
+    rng = np.random.default_rng(seed)
+    replicas = max(1, round(rows / profile['rows']))
+    started = time.perf_counter()
+    with open(path, 'w', newline='', encoding='utf-8-sig') as handle:
+        for offset in range(0, rows, chunk_size):
+            chunk = generate_chunk(profile, min(chunk_size, rows - offset), rng, replicas, null_rate)
+            chunk.to_csv(handle, header=offset == 0, index=False)
+    seconds = time.perf_counter() - started
+    print(f"Generated {rows} synthetic subscriptions in {path} in {seconds:.2f}s ({rows / seconds:,.0f} rows/s)")
+    return seconds
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic OLTP subscriptions shaped like the source extract")
+    parser.add_argument('--rows', type=int, required=True, help="Number of subscriptions to generate")
+    parser.add_argument('--output', type=str, default='synthetic_subscriptions.csv', help="Output CSV file")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Rows generated and written at a time")
+    parser.add_argument('--null-rate', type=float, default=DEFAULT_NULL_RATE, help="Extra share of nulls in gender, industry, birth and end dates")
+    parser.add_argument('--source', type=str, default=SOURCE_CSV, help="Extract whose distributions are reproduced")
+    args = parser.parse_args()
+    try:
+        write_synthetic_csv(args.output, args.rows, seed=args.seed, chunk_size=args.chunk_size,
+                            null_rate=args.null_rate, source=args.source)
+    except Exception as e:
+        print(f"Synthetic data generation failed: {e}", file=sys.stderr)
+        sys.exit(1)
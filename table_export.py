@@ -0,0 +1,111 @@
+import gzip
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import zstandard
+except ImportError:  # Only needed for --compression zstd
+    zstandard = None
+
+STAR_TABLES = ['fact_subscription', 'dim_student', 'dim_instructor', 'dim_course_offering', 'dim_time']
+EXPORT_FORMATS = {'csv': '.csv', 'text': '.tsv', 'binary': '.pgcopy'}
+COMPRESSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# Binary file wrapper that counts the bytes COPY writes through it
+class CountingWriter:
+    def __init__(self, handle):
+        self.handle = handle
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self.handle.write(data)
+
+# Fail before any table is exported when the format or compression cannot be written
+def check_export_options(export_format, compression):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}', expected one of {', '.join(EXPORT_FORMATS)}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}', expected one of {', '.join(COMPRESSIONS)}")
+    if compression == 'zstd' and zstandard is None:
+        raise RuntimeError("The zstandard package is required for --compression zstd")
+
+# Open the output file of one table, compressed on the fly
+def open_output(path, compression='none'):
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, 'wb')
+
+# Output file name of a table
+def export_path(output_dir, table, export_format='csv', compression='none'):
+    return os.path.join(output_dir, f'{table}{EXPORT_FORMATS[export_format]}{COMPRESSIONS[compression]}')
+
+# COPY ... TO STDOUT statement for one table; binary COPY has no header row
+def copy_to_statement(engine, schema, table, export_format='csv'):
+    preparer = engine.dialect.identifier_preparer
+    target = f'{preparer.quote_schema(schema)}.{preparer.quote(table)}' if schema else preparer.quote(table)
+    options = [f'FORMAT {export_format}']
+    if export_format != 'binary':
+        options.append('HEADER true')
+    return f"COPY {target} TO STDOUT WITH ({', '.join(options)})"
+
+# Stream one table from the server into its file; rows never pass through pandas. A failed
+# export does not leave a truncated file behind.
+def export_table(engine, schema, table, output_dir, export_format='csv', compression='none'):
+    check_export_options(export_format, compression)
+    path = export_path(output_dir, table, export_format, compression)
+    started = time.perf_counter()
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        with open_output(path, compression) as handle:
+            writer = CountingWriter(handle)
+            cursor.copy_expert(copy_to_statement(engine, schema, table, export_format), writer)
+        rows = cursor.rowcount
+        cursor.close()
+        connection.commit()
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    finally:
+        connection.close()
+    return {'table': table, 'path': path, 'rows': rows, 'bytes': writer.bytes_written,
+            'seconds': time.perf_counter() - started}
+
+# Print and return the throughput of one table export
+def report_export(stats):
+    seconds = stats['seconds']
+    rate = stats['rows'] / seconds if seconds > 0 else float('inf')
+    megabytes = stats['bytes'] / 1e6
+    print(f"Exported {stats['rows']} rows of {stats['table']} to {stats['path']} in {seconds:.2f}s "
+          f"({rate:,.0f} rows/s, {megabytes / seconds if seconds > 0 else 0:.1f} MB/s uncompressed)")
+    return {**stats, 'rows_per_second': rate}
+
+# Export several tables concurrently, one pooled connection per worker. Tables are reported as
+# they finish; a failing table is reported and the others still complete.
+def export_tables(engine, schema, tables, output_dir, export_format='csv', compression='none', workers=4):
+    check_export_options(export_format, compression)
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    results, failures = [], {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(export_table, engine, schema, table, output_dir, export_format, compression): table
+                   for table in tables}
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                failures[table] = e
+                print(f"Export of {table} failed: {e}")
+                continue
+            results.append(report_export(stats))
+    total_rows = sum(stats['rows'] for stats in results)
+    print(f"Exported {len(results)} tables ({total_rows} rows) in {time.perf_counter() - started:.2f}s")
+    if failures:
+        raise RuntimeError(f"Export failed for {', '.join(sorted(failures))}")
+    return results
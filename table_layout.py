@@ -0,0 +1,47 @@
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+# Years covered by a column of YYYYMMDD keys
+def key_years(keys):
+    keys = pd.Series(keys).dropna()
+    return sorted(set((keys // 10000).astype('int64').tolist()))
+
+# Fully qualified, quoted name of a table's partition for one year
+def partition_name(connection, table, year):
+    preparer = connection.dialect.identifier_preparer
+    name = preparer.quote(f'{table.name}_{year}')
+    return f'{preparer.quote_schema(table.schema)}.{name}' if table.schema else name
+
+# Create the yearly partitions the rows of frame fall into, for tables declared with a
+# partition_key (star_schema.build_metadata). Other tables are left alone.
+def ensure_partitions(connection, table, frame):
+    key = table.info.get('partition_key')
+    if key is None or frame.empty:
+        return
+    parent = connection.dialect.identifier_preparer.format_table(table)
+    existing = set(connection.execute(text(
+        "SELECT child.relname FROM pg_inherits JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:parent AS regclass)"), {'parent': parent}).scalars())
+    for year in key_years(frame[key]):
+        if f'{table.name}_{year}' in existing:
+            continue
+        partition = partition_name(connection, table, year)
+        connection.execute(text(f"CREATE TABLE {partition} PARTITION OF {parent} "
+                                f"FOR VALUES FROM ({year * 10000 + 101}) TO ({(year + 1) * 10000 + 101})"))
+        print(f"Created partition {partition} of {table.name}")
+
+# ensure_partitions in its own transaction, for loaders that open their own connections
+def create_partitions(engine, table, frame):
+    if 'partition_key' in table.info:
+        with engine.begin() as connection:
+            ensure_partitions(connection, table, frame)
+
+# Refresh planner statistics of every table once the load is done
+def analyze_tables(engine, metadata):
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            connection.execute(text(f"ANALYZE {connection.dialect.identifier_preparer.format_table(table)}"))
+    print(f"Analyzed {len(metadata.sorted_tables)} tables in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from concurrent_load import ConcurrentLoader, leaf_tables, load_levels, load_batches
+from star_schema import build_metadata
+
+DIMENSIONS = ('dim_student', 'dim_instructor', 'dim_course_offering', 'dim_time')
+
+@pytest.fixture
+def metadata():
+    return build_metadata('load_order_test')
+
+# Stub loader that only sleeps (dim_student the longest) and records when each table loaded
+class StubLoader:
+    def __init__(self, seconds=0.2, fail_on=None):
+        self.seconds = seconds
+        self.fail_on = fail_on
+        self.spans = {}
+        self.lock = threading.Lock()
+        self.__name__ = 'stub'
+
+    def __call__(self, engine, table, frame, **options):
+        started = time.perf_counter()
+        if table.name == self.fail_on:
+            raise ValueError(f"{table.name} failed")
+        time.sleep(self.seconds if table.name == 'dim_student' else self.seconds / 10)
+        with self.lock:
+            self.spans.setdefault(table.name, []).append((started, time.perf_counter()))
+
+    # Tables that started loading before a table they reference had finished
+    def violations(self, metadata):
+        violations = []
+        for table in metadata.sorted_tables:
+            for fk in table.foreign_keys:
+                parent = fk.column.table.name
+                if table.name in self.spans and parent in self.spans:
+                    started = min(start for start, _ in self.spans[table.name])
+                    finished = max(end for _, end in self.spans[parent])
+                    if started < finished:
+                        violations.append(f"{table.name} started {finished - started:.2f}s before {parent} was loaded")
+        return sorted(set(violations))
+
+def test_leaf_tables_are_decided_over_the_whole_metadata(metadata):
+    assert leaf_tables(metadata, DIMENSIONS) == set()
+    assert leaf_tables(metadata, ['dim_time', 'fact_subscription']) == {'fact_subscription'}
+
+def test_load_levels_put_facts_after_their_dimensions(metadata):
+    levels = [[table.name for table in level] for level in load_levels(metadata, DIMENSIONS + ('fact_subscription',))]
+    assert levels[-1] == ['fact_subscription']
+    assert sorted(name for level in levels[:-1] for name in level) == sorted(DIMENSIONS)
+
+# The dimensions are submitted alone, as build_tables does, then the facts in slices: no fact
+# slice may start before every dimension is loaded, however long the slowest one takes
+def test_facts_wait_for_dimensions_submitted_in_an_earlier_batch(metadata):
+    stub = StubLoader()
+    frame = pd.DataFrame({'ID': [1]})
+    concurrent = ConcurrentLoader(None, metadata, loader=stub)
+    concurrent.submit({name: frame for name in DIMENSIONS})
+    stats = load_batches(concurrent, ({'fact_subscription': frame} for _ in range(3)))
+
+    assert stub.violations(metadata) == []
+    assert {load['table']: load['rows'] for load in stats} == {**{name: 1 for name in DIMENSIONS}, 'fact_subscription': 3}
+
+def test_a_failed_load_is_raised_on_close(metadata):
+    frame = pd.DataFrame({'ID': [1]})
+    concurrent = ConcurrentLoader(None, metadata, loader=StubLoader(seconds=0.01, fail_on='fact_subscription'))
+    with pytest.raises(RuntimeError, match='fact_subscription failed'):
+        load_batches(concurrent, [{name: frame for name in DIMENSIONS}, {'fact_subscription': frame}])